@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import random
+import hashlib
+import yaml
+
+import convert_coco_2_yolo_format as converter
+from contact_sheet import TILE_SIZE, write_class_contact_sheets
+from generate_id2names_from_class_dag import process_yaml
+from image_loader import prefetch_images
+from map_coco_labels_2_class_hierarchy_labels import compile_label_mapping, hash_files, load_names, remap_label_file
+
+# Inputs
+CLASS_DAG_YAML = "class_dag.yaml"
+FLAT_NAMES_YAML = "id2names.yaml"
+HIERARCHY_NAMES_YAML = "id2names_class_hierarchy.yaml"
+SPLITS = ["train", "val"]
+
+# Outputs
+FLAT_DIR = converter.YOLO_OUTPUT_DIR
+HIERARCHY_DIR = os.path.join(converter.YOLO_OUTPUT_DIR, "class_hierarchy")
+SUNBURST_DIR = "class_hierarchy"
+GALLERY_SPLIT = "train"
+GALLERY_EXAMPLES = 3
+BUILD_GALLERIES = True
+LINK_IMAGES = converter.LINK_IMAGES  # link the COCO images into <flat|hierarchy>/<split>/images
+
+# Which inputs every output was derived from (hashes / file signatures)
+MANIFEST_PATH = os.path.join(converter.YOLO_OUTPUT_DIR, "build_manifest.json")
+UNMAPPED_POLICY = "drop"  # see map_coco_labels_2_class_hierarchy_labels.UNMAPPED_POLICIES
+
+WATCH = True        # keep polling the inputs and rebuilding what changed
+POLL_SECONDS = 5.0
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+class Manifest(dict):
+    """The build manifest; stages set dirty when they change it."""
+    dirty = False
+
+def load_manifest(path):
+    if os.path.isfile(path):
+        with open(path, "r") as f:
+            return Manifest(json.load(f))
+    return Manifest()
+
+def save_manifest(manifest, path):
+    """
+    Write the manifest atomically so an interrupted build never corrupts it.
+    Nothing is written unless a stage changed it (it holds an entry per label
+    file, so re-serializing it on every no-op poll would dominate watch mode).
+    """
+    if not manifest.dirty:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        f.write(json.dumps(manifest))
+    os.replace(path + ".tmp", path)
+    manifest.dirty = False
+
+def stat_signature(path):
+    """Cheap change detector for large inputs: [size, mtime_ns]."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def read_label_classes(label_path):
+    """Sorted unique class indices used in a YOLO label file."""
+    with open(label_path, "r") as f:
+        return sorted({int(parts[0]) for parts in (line.split() for line in f) if parts})
+
+def subtree_signatures(yaml_data):
+    """
+    Hash every node that has children from its position in the tree and
+    everything below it, walking the YAML the same way
+    visualize_class_hierarchy.process_node does. A node's sunburst only
+    needs re-rendering when its signature changes.
+    """
+    signatures = {}
+
+    def visit(name, data, chain):
+        children = []
+        if isinstance(data, dict):
+            children = list(data.items())
+        elif isinstance(data, list):
+            for item in data:
+                if isinstance(item, dict):
+                    children.extend(item.items())
+                else:
+                    children.append((item, None))
+        child_signatures = [visit(str(k), v, chain + [name]) for k, v in children]
+        signature = hashlib.sha256(json.dumps([chain, name, child_signatures]).encode()).hexdigest()
+        if children:
+            signatures[name] = signature
+        return signature
+
+    for key, value in yaml_data.items():
+        visit(str(key), value, [])
+    return signatures
+
+def build_hierarchy_names(manifest):
+    """id2names_class_hierarchy.yaml <- class_dag.yaml"""
+    source = hash_files(CLASS_DAG_YAML)
+    if manifest.get("hierarchy_names") == source and os.path.isfile(HIERARCHY_NAMES_YAML):
+        return False
+    process_yaml(CLASS_DAG_YAML, HIERARCHY_NAMES_YAML)
+    manifest["hierarchy_names"] = source
+    manifest.dirty = True
+    return True
+
+def build_flat_labels(manifest, split):
+    """<flat>/<split>/labels <- annotations/instances_<split>2017.json"""
+    json_path = os.path.join(converter.COCO_ANNOTATIONS_DIR, f"instances_{split}2017.json")
+    if not os.path.isfile(json_path):
+        return False
+    record = manifest.setdefault("flat_labels", {}).get(split, {})
+    signature = stat_signature(json_path)
+    if record.get("stat") == signature:
+        return False
+    # Only hash the (large) JSON when its size or mtime moved
+    source = hash_files(json_path)
+    if record.get("sha256") != source:
+        flat_variants = [v for v in converter.LABEL_VARIANTS if not v.get("names_yaml")]
+        converter.convert_coco_to_yolo_variants(
+            json_path,
+            os.path.join(converter.COCO_IMAGES_DIR, f"{split}2017"),
+            flat_variants,
+            split,
+            skip_crowd=converter.SKIP_CROWD,
+            min_area=converter.MIN_AREA,
+            label_format=converter.LABEL_FORMAT,
+        )
+    manifest["flat_labels"][split] = {"stat": signature, "sha256": source}
+    manifest.dirty = True
+    return record.get("sha256") != source
+
+def link_split_images(split):
+    """
+    <flat|hierarchy>/<split>/images <- per-file links to the COCO images of the
+    split, adding only the ones that are missing (galleries need them).
+
+    Returns:
+        int: Number of links added.
+    """
+    image_dir = os.path.join(converter.COCO_IMAGES_DIR, f"{split}2017")
+    if not os.path.isdir(image_dir):
+        return 0
+    file_names = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return sum(
+        converter.link_images(os.path.join(output_dir, split, "images"), image_dir, file_names)
+        for output_dir in (FLAT_DIR, HIERARCHY_DIR)
+    )
+
+def build_hierarchy_labels(manifest, split, mapping):
+    """
+    <hierarchy>/<split>/labels/<file> <- <flat>/<split>/labels/<file> + the mapped
+    indices of the classes it contains. A file is only rewritten when its own
+    contents changed or when the new index of one of its classes changed.
+
+    Returns:
+        tuple: (files rewritten, {new class index: [label files containing it]})
+    """
+    flat_dir = os.path.join(FLAT_DIR, split, "labels")
+    out_dir = os.path.join(HIERARCHY_DIR, split, "labels")
+    entries = manifest.setdefault("hierarchy_labels", {}).setdefault(split, {})
+    class_files = {}
+    rewritten = 0
+    if not os.path.isdir(flat_dir):
+        return rewritten, class_files
+    os.makedirs(out_dir, exist_ok=True)
+    existing = set(os.listdir(out_dir))
+
+    # Plain-list lookup: per file this is a handful of classes, where numpy's
+    # per-call overhead would dominate across ~118k files
+    forward = mapping.forward.tolist()
+    filenames = sorted(f for f in os.listdir(flat_dir) if f.endswith(".txt"))
+    for filename in filenames:
+        input_file = os.path.join(flat_dir, filename)
+        output_file = os.path.join(out_dir, filename)
+        signature = stat_signature(input_file)
+        entry = entries.get(filename)
+        if entry is None or entry["stat"] != signature:
+            entry = {"stat": signature, "classes": read_label_classes(input_file)}
+            entries[filename] = entry
+            manifest.dirty = True
+        mapped = [forward[c] if 0 <= c < len(forward) else -1 for c in entry["classes"]]
+        key = [signature, mapped]
+        if entry.get("key") != key or filename not in existing:
+            remap_label_file(input_file, output_file, mapping, UNMAPPED_POLICY)
+            entry["key"] = key
+            manifest.dirty = True
+            rewritten += 1
+        for c in mapped:
+            if c >= 0:
+                class_files.setdefault(c, []).append(filename)
+
+    # Outputs whose source label file disappeared
+    for filename in set(entries) - set(filenames):
+        del entries[filename]
+        manifest.dirty = True
+        if os.path.isfile(os.path.join(out_dir, filename)):
+            os.remove(os.path.join(out_dir, filename))
+            rewritten += 1
+    return rewritten, class_files
+
+def build_sunbursts(manifest):
+    """class_hierarchy/.../<node>.png <- the node's subtree in class_dag.yaml"""
+    with open(CLASS_DAG_YAML, "r") as f:
+        yaml_data = yaml.safe_load(f)
+    signatures = subtree_signatures(yaml_data)
+    recorded = manifest.setdefault("sunbursts", {})
+    stale = [node for node, sig in signatures.items() if recorded.get(node) != sig]
+    if not stale:
+        return []
+
+    # Imported lazily: plotly/kaleido are only needed when something is re-rendered
+    from visualize_class_hierarchy import build_node_frame, write_sunburst
+
+    df = build_node_frame(yaml_data)
+    for node in stale:
+        write_sunburst(node, df, SUNBURST_DIR)
+        recorded[node] = signatures[node]
+    for node in set(recorded) - set(signatures):
+        del recorded[node]
+    manifest.dirty = True
+    return stale
+
+def build_galleries(manifest, class_files, names):
+    """
+    <hierarchy>/<split>/example_images_class_hierarchy/<class>.jpg <- the
+    class's name/ancestors and the label files that contain it. A class is
+    only recorded once its sheet was written, so classes whose sampled images
+    are not linked yet are retried on the next build.
+    """
+    from visualize_images_w_class_hierarchy_labels import build_parent_map, get_full_chain
+
+    with open(CLASS_DAG_YAML, "r") as f:
+        parent_map = build_parent_map(yaml.safe_load(f)["class_dag"])
+    labels_dir = os.path.join(HIERARCHY_DIR, GALLERY_SPLIT, "labels")
+    images_dir = os.path.join(HIERARCHY_DIR, GALLERY_SPLIT, "images")
+    save_dir = os.path.join(HIERARCHY_DIR, GALLERY_SPLIT, "example_images_class_hierarchy")
+    entries = manifest["hierarchy_labels"][GALLERY_SPLIT]
+    recorded = manifest.setdefault("galleries", {})
+
+    chosen = []
+    sources = {}
+    for c, files in sorted(class_files.items()):
+        chain = get_full_chain(c, names, parent_map)
+        source = hashlib.sha256(json.dumps([chain, [(f, entries[f]["key"]) for f in files]]).encode()).hexdigest()
+        if recorded.get(names[c]) == source:
+            continue
+        sources[c] = source
+        sample = random.Random(names[c]).sample(files, min(GALLERY_EXAMPLES, len(files)))
+        for idx, filename in enumerate(sample, start=1):
+            stem = os.path.splitext(filename)[0]
+            for ext in IMAGE_EXTENSIONS:
+                if os.path.isfile(os.path.join(images_dir, stem + ext)):
+                    chosen.append((c, idx, os.path.join(images_dir, stem + ext)))
+                    break
+    if not chosen:
+        return []
+
+    written = write_class_contact_sheets(
+        chosen,
+        prefetch_images([img_path for _, _, img_path in chosen], TILE_SIZE),
+        names,
+        label_path_for=lambda img_path: os.path.join(labels_dir, os.path.splitext(os.path.basename(img_path))[0] + ".txt"),
+        label_text_for=lambda cid: "\n".join(get_full_chain(cid, names, parent_map)) if 0 <= cid < len(names) else None,
+        save_dir=save_dir,
+        index_sheet=False,
+    )
+    written = set(written)
+    regenerated = []
+    for c in sorted({c for c, _, _ in chosen}):
+        if os.path.join(save_dir, f"{names[c]}.jpg") in written:
+            recorded[names[c]] = sources[c]
+            manifest.dirty = True
+            regenerated.append(names[c])
+    return regenerated
+
+def build(manifest_path=MANIFEST_PATH, manifest=None):
+    """
+    Bring every derived output up to date, recomputing only the outputs whose
+    recorded inputs changed. The manifest is saved after each stage that
+    changed it; pass an already loaded manifest to skip re-reading it.
+    """
+    if manifest is None:
+        manifest = load_manifest(manifest_path)
+    summary = []
+
+    if build_hierarchy_names(manifest):
+        summary.append(f"regenerated {HIERARCHY_NAMES_YAML}")
+    save_manifest(manifest, manifest_path)
+
+    mapping = compile_label_mapping(FLAT_NAMES_YAML, HIERARCHY_NAMES_YAML)
+    names = load_names(HIERARCHY_NAMES_YAML)
+    class_files = {}
+    for split in SPLITS:
+        if build_flat_labels(manifest, split):
+            summary.append(f"converted {split} annotations")
+        if LINK_IMAGES:
+            linked = link_split_images(split)
+            if linked:
+                summary.append(f"linked {linked} {split} images")
+        save_manifest(manifest, manifest_path)
+        rewritten, files = build_hierarchy_labels(manifest, split, mapping)
+        if rewritten:
+            summary.append(f"remapped {rewritten} {split} label files")
+        if split == GALLERY_SPLIT:
+            class_files = files
+        save_manifest(manifest, manifest_path)
+
+    stale = build_sunbursts(manifest)
+    if stale:
+        summary.append(f"re-rendered sunbursts: {', '.join(stale)}")
+    save_manifest(manifest, manifest_path)
+
+    if BUILD_GALLERIES and class_files:
+        galleries = build_galleries(manifest, class_files, names)
+        if galleries:
+            summary.append(f"regenerated galleries: {', '.join(galleries)}")
+        save_manifest(manifest, manifest_path)
+
+    if summary:
+        print("; ".join(summary))
+    return summary
+
+def watch(poll_seconds=POLL_SECONDS, manifest_path=MANIFEST_PATH):
+    """Rebuild whenever an input changes, polling every poll_seconds."""
+    print(f"Watching {CLASS_DAG_YAML}, {FLAT_NAMES_YAML} and the annotation/label directories...")
+    manifest = load_manifest(manifest_path)  # kept in memory between polls
+    while True:
+        try:
+            build(manifest_path, manifest)
+        except Exception as e:
+            # e.g. a half-saved class_dag.yaml while someone is editing it;
+            # the next poll retries with whatever is on disk then
+            print(f"Build failed, retrying in {poll_seconds}s: {e}")
+            manifest = load_manifest(manifest_path)  # drop the unsaved partial stage
+        time.sleep(poll_seconds)
+
+if __name__ == "__main__":
+    if WATCH:
+        watch()
+    elif not build():
+        print("Everything up to date.")
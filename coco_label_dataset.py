@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import os
+import cv2
+import numpy as np
+import torch
+import yaml
+from pathlib import Path
+from torch.utils.data import Dataset
+from tqdm import tqdm
+
+from generate_id2names_from_class_dag import build_ancestor_table
+from map_coco_labels_2_class_hierarchy_labels import load_names
+
+# Paths used when packing from the command line
+LABEL_DIR = "yolo_format/class_hierarchy/train/labels"
+IMAGE_DIR = "yolo_format/class_hierarchy/train/images"
+NAMES_YAML = "id2names_class_hierarchy.yaml"
+CLASS_DAG_YAML = "class_dag.yaml"
+INDEX_DIR = "yolo_format/class_hierarchy/train/label_index"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def read_label_rows(label_path):
+    """Read the 5-field (class x y w h) rows of a YOLO label file as a float array."""
+    if not os.path.isfile(label_path):
+        return np.zeros((0, 5), dtype=np.float32)
+    with open(label_path, "r") as lf:
+        rows = [parts for parts in (line.split() for line in lf) if len(parts) == 5]
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+def pack_label_index(label_dir, image_dir, index_dir, names_yaml, class_dag_yaml=None):
+    """
+    Pack every YOLO label file into flat .npy arrays that the dataset memory-maps.
+
+    Written to index_dir:
+        image_files.npy   (M,) image paths as fixed-width bytes
+        offsets.npy       (M + 1,) int64, boxes of image i are rows offsets[i]:offsets[i + 1]
+        classes.npy       (N,) int32 class index per box
+        boxes.npy         (N, 4) float32 normalized xywh per box
+        ancestors.npy     (C, C) bool class -> ancestor table (identity without a class DAG)
+        box_ancestors.npy (N, ceil(C / 8)) uint8 per-box ancestor masks, bit-packed
+
+    Images without a label file are kept with zero boxes. Lines that are not
+    plain detection rows (e.g. YOLO-seg polygons) are skipped.
+    """
+    names = load_names(names_yaml)
+    if class_dag_yaml is not None:
+        with open(class_dag_yaml, "r") as f:
+            ancestors = build_ancestor_table(yaml.safe_load(f)["class_dag"], names)
+    else:
+        ancestors = np.eye(len(names), dtype=bool)
+
+    image_files = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    rows = [read_label_rows(os.path.join(label_dir, f"{p.stem}.txt"))
+            for p in tqdm(image_files, desc="Packing labels")]
+
+    counts = np.array([len(r) for r in rows], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    rows = np.concatenate(rows) if rows else np.zeros((0, 5), dtype=np.float32)
+    classes = rows[:, 0].astype(np.int32)
+    if len(classes) and (classes.min() < 0 or classes.max() >= len(names)):
+        raise ValueError(f"Class ids outside 0..{len(names) - 1} found in {label_dir}")
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "image_files.npy"), np.array([str(p) for p in image_files], dtype=bytes))
+    np.save(os.path.join(index_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(index_dir, "classes.npy"), classes)
+    np.save(os.path.join(index_dir, "boxes.npy"), np.ascontiguousarray(rows[:, 1:]))
+    np.save(os.path.join(index_dir, "ancestors.npy"), ancestors)
+    np.save(os.path.join(index_dir, "box_ancestors.npy"), np.packbits(ancestors[classes], axis=1))
+    print(f"Packed {len(classes)} boxes from {len(image_files)} images into {index_dir}")
+
+class PackedLabelDataset(Dataset):
+    """
+    Dataset over a label index written by pack_label_index.
+
+    The arrays are opened as read-only memory maps the first time a worker
+    touches them (never pickled into the worker), so every DataLoader worker
+    shares the same page-cache pages and no label text is parsed at runtime.
+    Each sample is a dict with "image" (RGB uint8 array, or None when
+    load_images is False), "im_file", "classes" (n,), "boxes" (n, 4) and
+    "ancestors" (n, C) bool masks of each box's class and its ancestors.
+    """
+
+    ARRAYS = ("image_files", "offsets", "classes", "boxes", "ancestors", "box_ancestors")
+
+    def __init__(self, index_dir, transform=None, load_images=True):
+        self.index_dir = index_dir
+        self.transform = transform
+        self.load_images = load_images
+        self._arrays = None
+        self._length = len(np.load(os.path.join(index_dir, "offsets.npy"), mmap_mode="r")) - 1
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {
+                name: np.load(os.path.join(self.index_dir, f"{name}.npy"), mmap_mode="r")
+                for name in self.ARRAYS
+            }
+        return self._arrays
+
+    @property
+    def num_classes(self):
+        return self.arrays["ancestors"].shape[0]
+
+    def __getstate__(self):
+        # Workers reopen the memory maps instead of receiving copies of them
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        arrays = self.arrays
+        start, end = int(arrays["offsets"][index]), int(arrays["offsets"][index + 1])
+        im_file = arrays["image_files"][index].decode()
+
+        ancestors = np.unpackbits(arrays["box_ancestors"][start:end], axis=1, count=self.num_classes)
+        sample = {
+            "im_file": im_file,
+            "image": None,
+            "classes": torch.from_numpy(np.array(arrays["classes"][start:end], dtype=np.int64)),
+            "boxes": torch.from_numpy(np.array(arrays["boxes"][start:end])),
+            "ancestors": torch.from_numpy(ancestors.astype(bool)),
+        }
+        if self.load_images:
+            image_bgr = cv2.imread(im_file)
+            if image_bgr is not None:
+                sample["image"] = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+        if self.transform is not None:
+            sample = self.transform(sample)
+        return sample
+
+def collate_packed_labels(batch):
+    """
+    Collate samples with varying box counts: images and file names stay lists,
+    per-box tensors are concatenated with a batch_idx column (as in ultralytics).
+    """
+    return {
+        "im_file": [s["im_file"] for s in batch],
+        "image": [s["image"] for s in batch],
+        "batch_idx": torch.cat([torch.full((len(s["classes"]),), i, dtype=torch.int64) for i, s in enumerate(batch)]),
+        "classes": torch.cat([s["classes"] for s in batch]),
+        "boxes": torch.cat([s["boxes"] for s in batch]),
+        "ancestors": torch.cat([s["ancestors"] for s in batch]),
+    }
+
+if __name__ == "__main__":
+    pack_label_index(LABEL_DIR, IMAGE_DIR, INDEX_DIR, NAMES_YAML, CLASS_DAG_YAML)
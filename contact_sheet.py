@@ -0,0 +1,169 @@
+import os
+import cv2
+import numpy as np
+from itertools import groupby
+
+# Tile and drawing settings for contact sheets (colors are RGB)
+TILE_SIZE = 320
+BOX_COLOR = (255, 0, 0)
+TEXT_COLOR = (255, 255, 255)
+BACKGROUND_COLOR = (32, 32, 32)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.4
+TITLE_HEIGHT = 28
+
+def read_yolo_boxes(label_path):
+    """
+    Read a YOLO label file into arrays.
+
+    Returns:
+        tuple: (class_ids (N,), boxes (N, 4) normalized xywh). Lines that do
+        not have exactly 5 fields are skipped; a missing file gives empty arrays.
+    """
+    rows = []
+    if os.path.isfile(label_path):
+        with open(label_path, 'r') as lf:
+            rows = [parts for parts in (line.split() for line in lf) if len(parts) == 5]
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.float64)
+    values = np.array(rows, dtype=np.float64)
+    return values[:, 0].astype(np.int64), values[:, 1:]
+
+def draw_text_block(image, text, x, y, color=BOX_COLOR):
+    """Draw (possibly multi-line) text on a filled box whose top-left is (x, y)."""
+    h, w = image.shape[:2]
+    for line in text.split("\n"):
+        (tw, th), baseline = cv2.getTextSize(line, FONT, FONT_SCALE, 1)
+        x0 = int(min(max(x, 0), max(w - tw - 2, 0)))
+        y0 = int(min(max(y, 0), max(h - th - baseline - 2, 0)))
+        cv2.rectangle(image, (x0, y0), (x0 + tw + 2, y0 + th + baseline + 2), color, -1)
+        cv2.putText(image, line, (x0 + 1, y0 + th + 1), FONT, FONT_SCALE, TEXT_COLOR, 1, cv2.LINE_AA)
+        y = y0 + th + baseline + 2
+
+def draw_labeled_boxes(image, boxes, labels, thickness=2):
+    """
+    Draw normalized YOLO boxes and their labels onto an RGB image in place.
+    A label of None draws nothing for that box.
+    """
+    img_h, img_w = image.shape[:2]
+    if len(boxes) == 0:
+        return image
+    # Convert YOLO normalized coords to pixel corners for every box at once
+    x_min = (boxes[:, 0] - boxes[:, 2] / 2) * img_w
+    y_min = (boxes[:, 1] - boxes[:, 3] / 2) * img_h
+    x_max = (boxes[:, 0] + boxes[:, 2] / 2) * img_w
+    y_max = (boxes[:, 1] + boxes[:, 3] / 2) * img_h
+    corners = np.stack([x_min, y_min, x_max, y_max], axis=1).round().astype(np.int64)
+
+    for (x0, y0, x1, y1), label in zip(corners.tolist(), labels):
+        if label is None:
+            continue
+        cv2.rectangle(image, (x0, y0), (x1, y1), BOX_COLOR, thickness)
+        draw_text_block(image, label, x0, y0)
+    return image
+
+def make_tile(image_rgb, boxes, labels, tile_size=TILE_SIZE):
+    """
+    Resize an image to fit a square tile, draw its boxes at tile resolution
+    (so line widths and text stay legible), and pad it to tile_size x tile_size.
+    """
+    tile = np.full((tile_size, tile_size, 3), BACKGROUND_COLOR, dtype=np.uint8)
+    if image_rgb is None:
+        return tile
+    img_h, img_w = image_rgb.shape[:2]
+    scale = tile_size / max(img_h, img_w)
+    new_w, new_h = max(int(img_w * scale), 1), max(int(img_h * scale), 1)
+    resized = cv2.resize(image_rgb, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    draw_labeled_boxes(resized, boxes, labels)
+    top, left = (tile_size - new_h) // 2, (tile_size - new_w) // 2
+    tile[top:top + new_h, left:left + new_w] = resized
+    return tile
+
+def caption_tile(tile, caption):
+    """Write a caption along the bottom of a tile (used for the index sheet)."""
+    draw_text_block(tile, caption, 0, tile.shape[0])
+    return tile
+
+def make_contact_sheet(tiles, columns, title=None):
+    """
+    Tile equally sized images into one mosaic array, row-major, with an
+    optional title bar across the top.
+    """
+    columns = max(1, min(columns, len(tiles)))
+    rows = -(-len(tiles) // columns)
+    tile_h, tile_w = tiles[0].shape[:2]
+    sheet = np.full((rows * tile_h, columns * tile_w, 3), BACKGROUND_COLOR, dtype=np.uint8)
+    for i, tile in enumerate(tiles):
+        r, c = divmod(i, columns)
+        sheet[r * tile_h:(r + 1) * tile_h, c * tile_w:(c + 1) * tile_w] = tile
+    if title:
+        bar = np.full((TITLE_HEIGHT, sheet.shape[1], 3), BACKGROUND_COLOR, dtype=np.uint8)
+        cv2.putText(bar, title, (6, TITLE_HEIGHT - 9), FONT, 0.6, TEXT_COLOR, 1, cv2.LINE_AA)
+        sheet = np.vstack([bar, sheet])
+    return sheet
+
+def write_image(path, image_rgb, quality=90):
+    """Write an RGB array as a JPEG."""
+    cv2.imwrite(str(path), cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+def write_class_contact_sheets(chosen, images, class_names, label_path_for, label_text_for, save_dir,
+                               columns=3, tile_size=TILE_SIZE, index_sheet=True, label_mapping=None,
+                               policy="error"):
+    """
+    Write one contact sheet per class instead of one figure per example.
+
+    Parameters:
+        chosen (list): (class_id, idx, img_path) tuples, grouped by class.
+        images (iterable): Decoded RGB images aligned with chosen (None if unreadable).
+        class_names (dict or list): class_id -> class name, used for file names and titles.
+        label_path_for (callable): img_path -> path of its YOLO label file.
+        label_text_for (callable): class_id -> text drawn on the box, or None to skip it.
+        save_dir (str or Path): Directory receiving <class_name>.jpg sheets.
+        columns (int): Tiles per row.
+        tile_size (int): Side of each square tile in pixels.
+        index_sheet (bool): Also write index.jpg with the first tile of every class.
+        label_mapping (LabelMapping): Remaps the label files' class ids before
+            drawing, handling unmapped ones according to policy.
+        policy (str): One of map_coco_labels_2_class_hierarchy_labels.UNMAPPED_POLICIES.
+
+    Returns:
+        list: Paths of the sheets written.
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    written = []
+    index_tiles = []
+    examples = zip(chosen, images)
+
+    for class_id, group in groupby(examples, key=lambda example: example[0][0]):
+        tiles = []
+        for (_, _, img_path), image_rgb in group:
+            if image_rgb is None:
+                continue
+            label_path = label_path_for(img_path)
+            class_ids, boxes = read_yolo_boxes(label_path)
+            if label_mapping is not None:
+                try:
+                    class_ids, keep = label_mapping.remap(class_ids, policy)
+                except ValueError as e:
+                    raise ValueError(f"{label_path}: {e}") from None
+                class_ids, boxes = class_ids[keep], boxes[keep]
+            labels = [label_text_for(cid) for cid in class_ids.tolist()]
+            tiles.append(make_tile(image_rgb, boxes, labels, tile_size))
+        if not tiles:
+            continue
+
+        class_name = class_names[class_id]
+        sheet_path = os.path.join(save_dir, f"{class_name}.jpg")
+        write_image(sheet_path, make_contact_sheet(tiles, columns, title=class_name))
+        written.append(sheet_path)
+        index_tiles.append(caption_tile(tiles[0].copy(), class_name))
+        print(f"Saved contact sheet for class '{class_name}' -> {sheet_path}")
+
+    if index_sheet and index_tiles:
+        index_path = os.path.join(save_dir, "index.jpg")
+        columns = int(np.ceil(np.sqrt(len(index_tiles))))
+        write_image(index_path, make_contact_sheet(index_tiles, columns))
+        written.append(index_path)
+        print(f"Saved index sheet -> {index_path}")
+
+    return written
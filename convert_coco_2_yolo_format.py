@@ -1,11 +1,50 @@
 import os
+import glob
 import json
+import hashlib
+import itertools
+import numpy as np
+import yaml
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
+from image_loader import read_image_size
+from map_coco_labels_2_class_hierarchy_labels import load_labels, load_names
+
 # Define paths
 COCO_ANNOTATIONS_DIR = "/data/naddeok/coco/annotations/"
 COCO_IMAGES_DIR = "/data/naddeok/coco/images/"
 YOLO_OUTPUT_DIR = "/data/naddeok/coco/yolo_format/"
+# The names/class-DAG YAMLs live next to this script, so the converter works
+# from any working directory (e.g. when fetch_coco_data.py is run from the data dir)
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Annotation filters applied while converting
+SKIP_CROWD = True        # drop iscrowd=1 annotations (RLE blobs covering many objects)
+MIN_AREA = 0.0           # drop annotations whose COCO "area" (pixels) is below this
+CATEGORY_SUBSET = None   # e.g. ["cat", "dog"] to keep only those in the flat labels; None keeps all
+LABEL_FORMAT = "bbox"    # "bbox" for YOLO detection labels, "polygon" for YOLO-seg labels
+FLAT_NAMES_YAML = os.path.join(REPO_DIR, "id2names.yaml")  # names of the flat (COCO category order) labels
+
+# Ultralytics outputs: a dataset YAML per variant and a ready-made labels.cache
+# per split, so the trainer does not re-scan every image and label file
+WRITE_ULTRALYTICS_FILES = True
+LINK_IMAGES = True  # link every COCO image into <split>/images (per-file symlinks) if not already there
+ULTRALYTICS_CACHE_VERSION = "1.0.3"  # DATASET_CACHE_VERSION of the pinned ultralytics==8.3.93
+ULTRALYTICS_IMG_FORMATS = {"bmp", "dng", "jpeg", "jpg", "mpo", "png", "tif", "tiff", "webp", "pfm", "heic"}
+
+# Label sets written from a single annotation load. Each variant gets its own
+# output dir and, optionally, a names YAML to remap into and a category subset.
+LABEL_VARIANTS = [
+    {"name": "flat", "output_dir": YOLO_OUTPUT_DIR, "categories": CATEGORY_SUBSET},
+    {
+        "name": "class_hierarchy",
+        "output_dir": os.path.join(YOLO_OUTPUT_DIR, "class_hierarchy"),
+        "names_yaml": os.path.join(REPO_DIR, "id2names_class_hierarchy.yaml"),
+        "class_dag_yaml": os.path.join(REPO_DIR, "class_dag.yaml"),
+    },
+]
 
 
 
@@ -15,67 +54,520 @@ def load_coco_annotations(json_file):
         return json.load(f)
 
 # Convert COCO bounding box format to YOLO format
+# (works on scalars or on numpy arrays of boxes)
 def convert_bbox_to_yolo(image_width, image_height, bbox):
     x, y, w, h = bbox
     x_center = (x + w / 2) / image_width
     y_center = (y + h / 2) / image_height
-    w /= image_width
-    h /= image_height
+    w = w / image_width
+    h = h / image_height
     return x_center, y_center, w, h
 
-# Process annotations and save in YOLO format
-def convert_coco_to_yolo(coco_json, image_dir, output_dir):
-    data = load_coco_annotations(coco_json)
-    
-    images = {img["id"]: img for img in data["images"]}
+def build_annotation_arrays(data):
+    """
+    Flatten the COCO annotation list into column arrays, one row per annotation.
+    Segmentations stay a plain list since polygons have ragged lengths.
+    """
     annotations = data["annotations"]
-    
-    # Build a map from COCO category ID to zero-based index
-    cat_id_to_idx = {}
-    for idx, cat in enumerate(data["categories"]):
-        cat_id_to_idx[cat["id"]] = idx
-    
-    # Use tqdm to show progress while converting annotations
-    for ann in tqdm(annotations, desc="Converting annotations"):
-        image_id = ann["image_id"]
-        bbox = ann["bbox"]
-        
-        # Use the lookup map to get the correct zero-based category index
-        if ann["category_id"] not in cat_id_to_idx:
-            continue
-        
-        category_id = cat_id_to_idx[ann["category_id"]]
-        
-        image_info = images.get(image_id)
-        if not image_info:
+    n = len(annotations)
+    return {
+        "image_id": np.fromiter((a["image_id"] for a in annotations), dtype=np.int64, count=n),
+        "category_id": np.fromiter((a["category_id"] for a in annotations), dtype=np.int64, count=n),
+        "bbox": np.array([a["bbox"] for a in annotations], dtype=np.float64).reshape(n, 4),
+        "area": np.fromiter((a.get("area", 0.0) for a in annotations), dtype=np.float64, count=n),
+        "iscrowd": np.fromiter((a.get("iscrowd", 0) for a in annotations), dtype=bool, count=n),
+        "segmentation": [a.get("segmentation") for a in annotations],
+    }
+
+def build_image_arrays(data):
+    """
+    Column arrays for the COCO image table, sorted by image id so annotations
+    can be joined to their image with a binary search.
+    """
+    images = sorted(data["images"], key=lambda img: img["id"])
+    n = len(images)
+    return {
+        "id": np.fromiter((img["id"] for img in images), dtype=np.int64, count=n),
+        "width": np.fromiter((img["width"] for img in images), dtype=np.float64, count=n),
+        "height": np.fromiter((img["height"] for img in images), dtype=np.float64, count=n),
+        "file_name": [img["file_name"] for img in images],
+        "stem": [os.path.splitext(img["file_name"])[0] for img in images],
+    }
+
+def merge_multi_segment(segments):
+    """
+    Join the parts of a multi-polygon object into one polygon, the way
+    ultralytics.data.converter.merge_multi_segment does: consecutive parts are
+    connected at their closest vertices and walked forward then back, so the
+    thin connecting seams enclose no area.
+    """
+    segments = [np.array(seg, dtype=np.float64).reshape(-1, 2) for seg in segments]
+    idx_list = [[] for _ in range(len(segments))]
+    # Closest vertex pair between each part and the next
+    for i in range(1, len(segments)):
+        dist = ((segments[i - 1][:, None, :] - segments[i][None, :, :]) ** 2).sum(-1)
+        idx1, idx2 = np.unravel_index(np.argmin(dist), dist.shape)
+        idx_list[i - 1].append(int(idx1))
+        idx_list[i].append(int(idx2))
+
+    merged = []
+    # Forward pass
+    for i, idx in enumerate(idx_list):
+        if len(idx) == 2 and idx[0] > idx[1]:
+            idx = idx[::-1]
+            segments[i] = segments[i][::-1, :]
+        segments[i] = np.roll(segments[i], -idx[0], axis=0)
+        segments[i] = np.concatenate([segments[i], segments[i][:1]])
+        if i in {0, len(idx_list) - 1}:
+            merged.append(segments[i])
+        else:
+            merged.append(segments[i][:idx[1] - idx[0] + 1])
+    # Backward pass over the middle parts
+    for i in range(len(idx_list) - 2, 0, -1):
+        merged.append(segments[i][abs(idx_list[i][1] - idx_list[i][0]):])
+    return np.concatenate(merged, axis=0).reshape(-1).tolist()
+
+def normalize_polygons(segmentations, widths, heights):
+    """
+    Normalize COCO polygon segmentations to [0, 1] image coordinates.
+
+    Every polygon is concatenated into one flat coordinate array so the division
+    by width (x) / height (y) happens in a single vectorized step. Objects split
+    into several polygons (e.g. occluded ones) have their parts merged with
+    merge_multi_segment; RLE (crowd) masks have no polygon form and come back
+    as None.
+    """
+    chosen = []
+    for seg in segmentations:
+        if isinstance(seg, list) and len(seg) > 1:
+            chosen.append(merge_multi_segment(seg))
+        elif isinstance(seg, list) and seg:
+            chosen.append(seg[0])
+        else:
+            chosen.append([])
+    lengths = np.fromiter((len(p) for p in chosen), dtype=np.int64, count=len(chosen))
+    coords = np.fromiter(itertools.chain.from_iterable(chosen), dtype=np.float64, count=int(lengths.sum()))
+
+    # Polygons always have an even number of values, so the global parity of an
+    # index matches its parity inside its own polygon: even -> x, odd -> y.
+    scale = np.repeat(widths, lengths)
+    scale[1::2] = np.repeat(heights, lengths)[1::2]
+    coords /= scale
+
+    polygons = np.split(coords, np.cumsum(lengths)[:-1]) if len(chosen) else []
+    return [p if len(p) >= 6 else None for p in polygons]
+
+def check_category_names(categories, names):
+    """Raise a ValueError naming every requested category that is not in names."""
+    missing = [name for name in categories if name not in names]
+    if missing:
+        raise ValueError(f"Categories {missing} are not in the COCO categories.")
+
+def normalize_annotations(data, skip_crowd=False, min_area=0.0, categories=None, polygons=False):
+    """
+    Filter and normalize every annotation in one vectorized pass.
+
+    Parameters:
+        data (dict): Parsed COCO annotation JSON.
+        skip_crowd (bool): Drop annotations with iscrowd=1.
+        min_area (float): Drop annotations whose COCO "area" is below this.
+        categories (list): Category names to keep; None keeps all.
+        polygons (bool): Also normalize segmentation polygons. Annotations
+            without a usable polygon are dropped in this mode.
+
+    Returns:
+        dict: The normalized annotation stream with keys
+            "images" (image column arrays), "names" (category names by index),
+            "image_row" (image row per kept annotation), "class_idx",
+            "boxes" (YOLO xywh, normalized) and "polygons" (list or None).
+    """
+    images = build_image_arrays(data)
+    ann = build_annotation_arrays(data)
+
+    # Build a dense lookup from COCO category ID to zero-based index
+    names = [cat["name"] for cat in data["categories"]]
+    cat_ids = np.array([cat["id"] for cat in data["categories"]], dtype=np.int64)
+    max_id = max(int(cat_ids.max(initial=0)), int(ann["category_id"].max(initial=0)))
+    cat_lookup = np.full(max_id + 1, -1, dtype=np.int64)
+    cat_lookup[cat_ids] = np.arange(len(cat_ids))
+    class_idx = cat_lookup[ann["category_id"]]
+
+    # Join annotations to their image rows
+    image_row = np.searchsorted(images["id"], ann["image_id"])
+    image_row = np.minimum(image_row, max(len(images["id"]) - 1, 0))
+    has_image = len(images["id"]) > 0
+    keep = (class_idx >= 0) & (images["id"][image_row] == ann["image_id"] if has_image else False)
+
+    if skip_crowd:
+        keep &= ~ann["iscrowd"]
+    if min_area > 0:
+        keep &= ann["area"] >= min_area
+    if categories is not None:
+        check_category_names(categories, names)
+        wanted = [names.index(name) for name in categories]
+        keep &= np.isin(class_idx, wanted)
+
+    idx = np.flatnonzero(keep)
+    image_row = image_row[idx]
+    widths = images["width"][image_row]
+    heights = images["height"][image_row]
+
+    polys = None
+    if polygons:
+        polys = normalize_polygons([ann["segmentation"][i] for i in idx], widths, heights)
+        has_poly = np.array([p is not None for p in polys], dtype=bool)
+        idx, image_row, widths, heights = idx[has_poly], image_row[has_poly], widths[has_poly], heights[has_poly]
+        polys = [p for p in polys if p is not None]
+
+    boxes = np.stack(convert_bbox_to_yolo(widths, heights, ann["bbox"][idx].T), axis=1)
+
+    return {
+        "images": images,
+        "names": names,
+        "image_row": image_row,
+        "class_idx": class_idx[idx],
+        "boxes": boxes,
+        "polygons": polys,
+    }
+
+def format_label_lines(class_idx, boxes, polygons=None):
+    """Format one image's labels as YOLO (or YOLO-seg) text lines."""
+    if polygons is None:
+        rows = boxes.tolist()
+        return [f"{c} {' '.join(map(str, row))}" for c, row in zip(class_idx.tolist(), rows)]
+    return [f"{c} {' '.join(map(str, p.tolist()))}" for c, p in zip(class_idx.tolist(), polygons)]
+
+def group_by_image(stream, class_map=None):
+    """
+    Group the stream's annotations by image (stable, so COCO order is kept).
+
+    class_map is an optional dense array mapping the stream's class indices to
+    output indices; entries of -1 drop the annotation.
+
+    Returns:
+        tuple: (mapped class_idx, image rows, list of annotation index arrays per row)
+    """
+    class_idx = stream["class_idx"]
+    keep = np.ones(len(class_idx), dtype=bool)
+    if class_map is not None:
+        class_idx = class_map[class_idx]
+        keep = class_idx >= 0
+
+    order = np.flatnonzero(keep)
+    order = order[np.argsort(stream["image_row"][order], kind="stable")]
+    rows, starts = np.unique(stream["image_row"][order], return_index=True)
+    groups = np.split(order, starts[1:]) if len(order) else []
+    return class_idx, rows, groups
+
+def write_yolo_labels(stream, output_dir, class_map=None, desc="Writing labels"):
+    """
+    Write the normalized annotation stream as one label file per image.
+
+    class_map is an optional dense array mapping the stream's class indices to
+    the indices written out; entries of -1 drop the annotation. Label files
+    left in the labels directory from an earlier run (e.g. with other filters)
+    whose image no longer has annotations are removed.
+    """
+    class_idx, rows, groups = group_by_image(stream, class_map)
+
+    labels_dir = os.path.join(output_dir, "labels")
+    os.makedirs(labels_dir, exist_ok=True)
+    stems = stream["images"]["stem"]
+    polygons = stream["polygons"]
+
+    written = set()
+    for row, group in tqdm(zip(rows.tolist(), groups), total=len(groups), desc=desc):
+        group_polys = None if polygons is None else [polygons[i] for i in group]
+        lines = format_label_lines(class_idx[group], stream["boxes"][group], group_polys)
+        label_filename = f"{stems[row]}.txt"
+        with open(os.path.join(labels_dir, label_filename), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        written.add(label_filename)
+
+    for filename in os.listdir(labels_dir):
+        if filename.endswith(".txt") and filename not in written:
+            os.remove(os.path.join(labels_dir, filename))
+
+    return len(groups)
+
+def link_images(images_dir, image_dir, file_names):
+    """
+    Fill images_dir with per-file symlinks into image_dir.
+
+    Ultralytics resolves the image directory path before globbing it, so a
+    single directory symlink would send its label lookup to image_dir's
+    sibling "labels" folder; per-file links keep the labels next to images_dir.
+    Only missing links are added, so images extracted after an earlier run
+    are picked up; an images_dir that is itself a symlink is left alone.
+
+    Returns:
+        int: Number of links added.
+    """
+    if os.path.islink(images_dir):
+        print(f"{images_dir} is a symlink, not adding per-file image links")
+        return 0
+    os.makedirs(images_dir, exist_ok=True)
+    existing = set(os.listdir(images_dir))
+    image_dir = os.path.abspath(image_dir)
+    added = 0
+    for file_name in file_names:
+        if file_name in existing:
             continue
+        src = os.path.join(image_dir, file_name)
+        if os.path.isfile(src):
+            os.symlink(src, os.path.join(images_dir, file_name))
+            added += 1
+    return added
+
+def ultralytics_hash(paths):
+    """Same as ultralytics.data.utils.get_hash: sha256 over the total size and the joined paths."""
+    size = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+    h = hashlib.sha256(str(size).encode())
+    h.update("".join(paths).encode())
+    return h.hexdigest()
+
+def img2label_path(im_file):
+    """Same as ultralytics.data.utils.img2label_paths for a single image."""
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return sb.join(im_file.rsplit(sa, 1)).rsplit(".", 1)[0] + ".txt"
+
+def segments_to_boxes(segments):
+    """xywh boxes enclosing each (k, 2) polygon, as ultralytics.utils.ops.segments2boxes."""
+    boxes = np.array([[s[:, 0].min(), s[:, 1].min(), s[:, 0].max(), s[:, 1].max()] for s in segments],
+                     dtype=np.float32).reshape(-1, 4)
+    return np.stack([
+        (boxes[:, 0] + boxes[:, 2]) / 2,
+        (boxes[:, 1] + boxes[:, 3]) / 2,
+        boxes[:, 2] - boxes[:, 0],
+        boxes[:, 3] - boxes[:, 1],
+    ], axis=1)
+
+def write_ultralytics_cache(stream, split_dir, class_map, num_classes):
+    """
+    Write <split_dir>/labels.cache in the format of the pinned ultralytics
+    YOLODataset, from the labels and image sizes already in memory.
+
+    The image list, label paths and hash are derived exactly as the trainer
+    derives them (resolved <split_dir>/images, globbed and sorted), so it
+    accepts the cache instead of verifying every image and label file. The
+    label checks it would apply (normalized, non-negative, class < nc, duplicate
+    rows removed) are replicated. Image shapes come from the COCO width/height.
+    Images without annotations in the stream are background (no label file,
+    as write_yolo_labels removes stale ones), whatever is left on disk.
+
+    Returns:
+        str: The cache path, or None when no cache could be written.
+    """
+    images_dir = Path(split_dir, "images").resolve()
+    if not images_dir.is_dir():
+        print(f"No images directory at {images_dir}, skipping the ultralytics cache")
+        return None
+    im_files = sorted(
+        x.replace("/", os.sep)
+        for x in glob.glob(str(images_dir / "**" / "*.*"), recursive=True)
+        if x.split(".")[-1].lower() in ULTRALYTICS_IMG_FORMATS
+    )
+    if not im_files:
+        return None
+    label_files = [img2label_path(x) for x in im_files]
+    cache_path = Path(label_files[0]).parent.with_suffix(".cache")
+    if Path(label_files[0]).parent.resolve() != Path(split_dir, "labels").resolve():
+        print(f"Ultralytics would read labels for {images_dir} from {Path(label_files[0]).parent}, skipping the cache")
+        return None
+
+    class_idx, rows, groups = group_by_image(stream, class_map)
+    group_of = dict(zip(rows.tolist(), groups))
+    images = stream["images"]
+    row_of = {os.path.basename(file_name): i for i, file_name in enumerate(images["file_name"])}
+    polygons = stream["polygons"]
 
-        img_width = image_info["width"]
-        img_height = image_info["height"]
-        yolo_bbox = convert_bbox_to_yolo(img_width, img_height, bbox)
+    labels, msgs = [], []
+    nm = nf = ne = nc = 0
+    for im_file in tqdm(im_files, desc="Caching labels"):
+        row = row_of.get(os.path.basename(im_file))
+        if row is not None:
+            shape = (int(images["height"][row]), int(images["width"][row]))
+        else:
+            size = read_image_size(im_file)
+            if size is None:
+                nc += 1
+                msgs.append(f"WARNING ⚠️ {im_file}: ignoring corrupt image/label: unreadable image")
+                continue
+            shape = (size[1], size[0])
 
-        # Define YOLO label file path
-        image_filename = os.path.splitext(image_info["file_name"])[0]
-        label_filepath = os.path.join(output_dir, f"labels/{image_filename}.txt")
+        segments = []
+        if row in group_of:
+            group = group_of[row]
+            cls = class_idx[group].astype(np.float32).reshape(-1, 1)
+            if polygons is None:
+                boxes = stream["boxes"][group].astype(np.float32)
+            else:
+                segments = [polygons[i].astype(np.float32).reshape(-1, 2) for i in group]
+                boxes = segments_to_boxes(segments)
+            lb = np.concatenate([cls, boxes], axis=1)
+            nf += 1
+        else:
+            lb = np.zeros((0, 5), dtype=np.float32)
+            nm += 1
+
+        if len(lb):
+            if lb[:, 1:].max() > 1 or lb.min() < 0 or lb[:, 0].max() >= num_classes:
+                nc += 1
+                msgs.append(f"WARNING ⚠️ {im_file}: ignoring corrupt image/label: out of bounds or invalid class")
+                continue
+            _, i = np.unique(lb, axis=0, return_index=True)
+            if len(i) < len(lb):
+                msgs.append(f"WARNING ⚠️ {im_file}: {len(lb) - len(i)} duplicate labels removed")
+                lb = lb[i]
+                if segments:
+                    segments = [segments[x] for x in i]
+
+        labels.append({
+            "im_file": im_file,
+            "shape": shape,
+            "cls": lb[:, 0:1],
+            "bboxes": lb[:, 1:],
+            "segments": segments,
+            "keypoints": None,
+            "normalized": True,
+            "bbox_format": "xywh",
+        })
+
+    x = {
+        "labels": labels,
+        "hash": ultralytics_hash(label_files + im_files),
+        "results": (nf, nm, ne, nc, len(im_files)),
+        "msgs": msgs,
+        "version": ULTRALYTICS_CACHE_VERSION,
+    }
+    with open(cache_path, "wb") as f:
+        np.save(f, x)
+    print(f"Ultralytics label cache saved to {cache_path}")
+    return str(cache_path)
+
+def write_dataset_yaml(variant, splits=("train", "val")):
+    """
+    Write the ultralytics dataset config for a label variant to
+    <output_dir>/cfgs/data/coco_<name>.yaml, with the names of the variant
+    and, for hierarchy variants, the 'class_dag' the visualizers expect.
+    """
+    names = load_names(variant.get("names_yaml") or FLAT_NAMES_YAML)
+    config = {"path": os.path.abspath(variant["output_dir"])}
+    for split in splits:
+        config[split] = f"{split}/images"
+    config["names"] = dict(enumerate(names))
+    if variant.get("class_dag_yaml"):
+        with open(variant["class_dag_yaml"], "r") as f:
+            config["class_dag"] = yaml.safe_load(f)["class_dag"]
+
+    config_path = os.path.join(variant["output_dir"], "cfgs", "data", f"coco_{variant['name']}.yaml")
+    os.makedirs(os.path.dirname(config_path), exist_ok=True)
+    with open(config_path, "w") as f:
+        yaml.dump(config, f, default_flow_style=False, sort_keys=False)
+    print(f"Dataset config saved to {config_path}")
+    return config_path
+
+# Process annotations and save in YOLO format
+def convert_coco_to_yolo(coco_json, image_dir, output_dir, skip_crowd=False, min_area=0.0,
+                         categories=None, label_format="bbox"):
+    data = load_coco_annotations(coco_json)
+
+    stream = normalize_annotations(
+        data,
+        skip_crowd=skip_crowd,
+        min_area=min_area,
+        categories=categories,
+        polygons=(label_format == "polygon"),
+    )
+    write_yolo_labels(stream, output_dir, desc="Converting annotations")
+    return stream
+
+def build_variant_class_map(names, variant):
+    """
+    Build the dense class map (stream index -> variant index, -1 = drop) for
+    one label variant from its optional names YAML and category subset.
+    """
+    class_map = np.arange(len(names), dtype=np.int64)
+    if variant.get("names_yaml"):
+        new_labels = load_labels(variant["names_yaml"])  # label_name -> new_index
+        class_map = np.array([new_labels.get(name, -1) for name in names], dtype=np.int64)
+    if variant.get("categories") is not None:
+        check_category_names(variant["categories"], names)
+        wanted = set(variant["categories"])
+        class_map[[name not in wanted for name in names]] = -1
+    return class_map
+
+def write_variant(stream, variant, split, image_dir, ultralytics=False, link=False):
+    """
+    Write one label variant for one split: the label files and, optionally,
+    per-file image links and the ultralytics label cache.
+    """
+    split_dir = os.path.join(variant["output_dir"], split)
+    class_map = build_variant_class_map(stream["names"], variant)
+    written = write_yolo_labels(stream, split_dir, class_map, f"Writing {variant['name']} {split} labels")
+    finish_variant(stream, variant, split, image_dir, ultralytics, link, class_map)
+    return written
+
+def finish_variant(stream, variant, split, image_dir, ultralytics=False, link=False, class_map=None):
+    """
+    Link the images and/or write the ultralytics label cache of one variant
+    whose label files are already written, without touching the labels.
+    """
+    split_dir = os.path.join(variant["output_dir"], split)
+    if class_map is None:
+        class_map = build_variant_class_map(stream["names"], variant)
+    if link:
+        link_images(os.path.join(split_dir, "images"), image_dir, stream["images"]["file_name"])
+    if ultralytics:
+        num_classes = len(load_names(variant.get("names_yaml") or FLAT_NAMES_YAML))
+        write_ultralytics_cache(stream, split_dir, class_map, num_classes)
+
+def convert_coco_to_yolo_variants(coco_json, image_dir, variants, split, skip_crowd=False,
+                                  min_area=0.0, label_format="bbox", ultralytics=False, link=False):
+    """
+    Load and normalize the annotations once, then write every label variant
+    from the same in-memory stream, one writer thread per variant.
+
+    Each variant is a dict with "name", "output_dir" and optionally
+    "names_yaml", "categories" and "class_dag_yaml"; labels go to
+    <output_dir>/<split>/labels. With ultralytics=True each variant also gets
+    <output_dir>/<split>/labels.cache (link=True first links the images).
+    """
+    data = load_coco_annotations(coco_json)
+    stream = normalize_annotations(
+        data,
+        skip_crowd=skip_crowd,
+        min_area=min_area,
+        polygons=(label_format == "polygon"),
+    )
+    del data  # the raw JSON is no longer needed once the stream is built
 
-        # Ensure output directories exist
-        os.makedirs(os.path.join(output_dir, "labels"), exist_ok=True)
+    with ThreadPoolExecutor(max_workers=len(variants)) as pool:
+        futures = {
+            variant["name"]: pool.submit(write_variant, stream, variant, split, image_dir, ultralytics, link)
+            for variant in variants
+        }
+        written = {name: future.result() for name, future in futures.items()}
 
-        # Save label to file without subtracting 1
-        with open(label_filepath, "a") as f:
-            f.write(f"{category_id} {' '.join(map(str, yolo_bbox))}\n")
+    return stream, written
 
-# Convert both train and validation datasets
-convert_coco_to_yolo(
-    os.path.join(COCO_ANNOTATIONS_DIR, "instances_train2017.json"),
-    os.path.join(COCO_IMAGES_DIR, "train2017"),
-    os.path.join(YOLO_OUTPUT_DIR, "train")
-)
+if __name__ == "__main__":
+    # Convert both train and validation datasets, writing every label variant
+    for split in ["train", "val"]:
+        convert_coco_to_yolo_variants(
+            os.path.join(COCO_ANNOTATIONS_DIR, f"instances_{split}2017.json"),
+            os.path.join(COCO_IMAGES_DIR, f"{split}2017"),
+            LABEL_VARIANTS,
+            split,
+            skip_crowd=SKIP_CROWD,
+            min_area=MIN_AREA,
+            label_format=LABEL_FORMAT,
+            ultralytics=WRITE_ULTRALYTICS_FILES,
+            link=LINK_IMAGES,
+        )
 
-convert_coco_to_yolo(
-    os.path.join(COCO_ANNOTATIONS_DIR, "instances_val2017.json"),
-    os.path.join(COCO_IMAGES_DIR, "val2017"),
-    os.path.join(YOLO_OUTPUT_DIR, "val")
-)
+    if WRITE_ULTRALYTICS_FILES:
+        for variant in LABEL_VARIANTS:
+            write_dataset_yaml(variant)
 
-print("Conversion to YOLO format completed successfully!")
+    print("Conversion to YOLO format completed successfully!")
@@ -1,33 +1,5 @@
-mkdir images
-cd images
-
-wget http://images.cocodataset.org/zips/train2017.zip
-wget http://images.cocodataset.org/zips/val2017.zip
-wget http://images.cocodataset.org/zips/test2017.zip
-wget http://images.cocodataset.org/zips/unlabeled2017.zip
-
-unzip train2017.zip
-unzip val2017.zip
-unzip test2017.zip
-unzip unlabeled2017.zip
-
-rm train2017.zip
-rm val2017.zip
-rm test2017.zip
-rm unlabeled2017.zip 
-
-cd ../
-wget http://images.cocodataset.org/annotations/annotations_trainval2017.zip
-wget http://images.cocodataset.org/annotations/stuff_annotations_trainval2017.zip
-wget http://images.cocodataset.org/annotations/image_info_test2017.zip
-wget http://images.cocodataset.org/annotations/image_info_unlabeled2017.zip
-
-unzip annotations_trainval2017.zip
-unzip stuff_annotations_trainval2017.zip
-unzip image_info_test2017.zip
-unzip image_info_unlabeled2017.zip
-
-rm annotations_trainval2017.zip
-rm stuff_annotations_trainval2017.zip
-rm image_info_test2017.zip
-rm image_info_unlabeled2017.zip
\ No newline at end of file
+# Downloads and extracts the COCO 2017 images and annotations.
+# All archives download concurrently (resumable ranged requests), each one is
+# extracted as soon as it is complete, and the YOLO conversion starts as soon
+# as annotations_trainval2017.zip lands. See fetch_coco_data.py for settings.
+python "$(dirname "$0")/fetch_coco_data.py"
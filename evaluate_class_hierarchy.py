@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+import os
+import json
+import numpy as np
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_id2names_from_class_dag import build_ancestor_table
+from map_coco_labels_2_class_hierarchy_labels import compile_label_mapping, load_names
+from validate_yolo_labels import box_iou, xywh_to_xyxy
+
+# Ground-truth labels (hierarchy indices) and predictions to score
+GT_LABEL_DIR = "yolo_format/class_hierarchy/val/labels"
+PRED_LABEL_DIR = "runs/detect/predict/labels"  # YOLO txt with "cls x y w h conf" rows
+NAMES_YAML = "id2names_class_hierarchy.yaml"
+CLASS_DAG_YAML = "class_dag.yaml"
+PRED_NAMES_YAML = None  # e.g. "id2names.yaml" when predictions use flat-80 indices
+REPORT_PATH = "yolo_format/class_hierarchy/val/hierarchy_eval.json"
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)  # COCO thresholds
+RECALL_POINTS = np.linspace(0, 1, 101)       # COCO 101-point interpolation
+WORKERS = os.cpu_count()
+
+def read_yolo_rows(label_path, n_fields):
+    """Read rows with exactly n_fields values from a YOLO txt file (empty if missing)."""
+    if not os.path.isfile(label_path):
+        return np.zeros((0, n_fields), dtype=np.float64)
+    with open(label_path, "r") as lf:
+        rows = [parts for parts in (line.split() for line in lf) if len(parts) == n_fields]
+    return np.array(rows, dtype=np.float64).reshape(-1, n_fields)
+
+def match_image(gt_classes, gt_boxes, pred_classes, pred_boxes, pred_scores, ancestors,
+                iou_thresholds=IOU_THRESHOLDS):
+    """
+    Match one image's predictions to its ground truth at every hierarchy node.
+
+    The prediction/GT IoU matrix is computed once; each node then reuses it,
+    restricted to the predictions and GT boxes whose class is the node or one of
+    its descendants (ancestors[class, node]). Matching is COCO-style greedy by
+    score, run for all IoU thresholds at once.
+
+    Returns:
+        tuple: (node (K,), score (K,), tp (T, K) bool) for every prediction at
+        every node it counts towards, and n_gt (C,) GT boxes per node.
+    """
+    n_gt = ancestors[gt_classes].sum(axis=0).astype(np.int64)
+    order = np.argsort(-pred_scores, kind="stable")
+    pred_classes, pred_boxes, pred_scores = pred_classes[order], pred_boxes[order], pred_scores[order]
+    iou = box_iou(xywh_to_xyxy(pred_boxes), xywh_to_xyxy(gt_boxes))
+
+    pred_at = ancestors[pred_classes]  # (P, C): prediction counts towards node
+    gt_at = ancestors[gt_classes]      # (G, C): GT box belongs to node
+    thresholds = np.asarray(iou_thresholds)[:, None]
+
+    nodes, scores, tps = [], [], []
+    for node in np.flatnonzero(pred_at.any(axis=0)):
+        preds = np.flatnonzero(pred_at[:, node])
+        gts = np.flatnonzero(gt_at[:, node])
+        tp = np.zeros((len(thresholds), len(preds)), dtype=bool)
+        if len(gts):
+            node_iou = iou[np.ix_(preds, gts)]
+            matched = np.zeros((len(thresholds), len(gts)), dtype=bool)
+            for k in range(len(preds)):
+                # Best still-unmatched GT per threshold, all thresholds at once
+                candidates = np.where(matched | (node_iou[k] < thresholds), -1.0, node_iou[k])
+                best = candidates.argmax(axis=1)
+                hit = candidates[np.arange(len(thresholds)), best] >= 0
+                matched[hit, best[hit]] = True
+                tp[:, k] = hit
+        nodes.append(np.full(len(preds), node, dtype=np.int64))
+        scores.append(pred_scores[preds])
+        tps.append(tp)
+
+    if not nodes:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros((len(thresholds), 0), dtype=bool), n_gt)
+    return np.concatenate(nodes), np.concatenate(scores), np.concatenate(tps, axis=1), n_gt
+
+def average_precision(tp, scores, n_gt):
+    """COCO 101-point interpolated AP per IoU threshold for one node."""
+    if n_gt == 0:
+        return np.full(tp.shape[0], np.nan)
+    if tp.shape[1] == 0:
+        return np.zeros(tp.shape[0])
+    order = np.argsort(-scores, kind="mergesort")
+    tp = tp[:, order]
+    tp_cum = np.cumsum(tp, axis=1)
+    fp_cum = np.cumsum(~tp, axis=1)
+    recall = tp_cum / n_gt
+    precision = tp_cum / np.maximum(tp_cum + fp_cum, np.finfo(np.float64).eps)
+    # Make precision monotonically decreasing, then sample it at the recall points
+    precision = np.flip(np.maximum.accumulate(np.flip(precision, axis=1), axis=1), axis=1)
+    ap = np.zeros(tp.shape[0])
+    for t in range(tp.shape[0]):
+        idx = np.searchsorted(recall[t], RECALL_POINTS, side="left")
+        sampled = np.zeros(len(RECALL_POINTS))
+        valid = idx < precision.shape[1]
+        sampled[valid] = precision[t, idx[valid]]
+        ap[t] = sampled.mean()
+    return ap
+
+def _match_image_job(args):
+    gt_path, pred_path, ancestors, pred_map = args
+    gt = read_yolo_rows(gt_path, 5)
+    pred = read_yolo_rows(pred_path, 6)
+    pred_classes = pred[:, 0].astype(np.int64)
+    if pred_map is not None:
+        pred_classes, keep = pred_map.remap(pred_classes, policy="drop")
+        pred, pred_classes = pred[keep], pred_classes[keep]
+    return match_image(gt[:, 0].astype(np.int64), gt[:, 1:5], pred_classes, pred[:, 1:5], pred[:, 5], ancestors)
+
+def evaluate_hierarchy(gt_dir, pred_dir, names_yaml, class_dag_yaml, pred_names_yaml=None, workers=WORKERS):
+    """
+    Score every node of the class hierarchy (leaves and every ancestor level)
+    in one pass over the images.
+
+    Parameters:
+        gt_dir (str): Ground-truth YOLO labels using the names_yaml indices.
+        pred_dir (str): Predicted YOLO labels with a trailing confidence column.
+        names_yaml (str): Hierarchy names YAML (e.g. id2names_class_hierarchy.yaml).
+        class_dag_yaml (str): YAML with the 'class_dag' key.
+        pred_names_yaml (str): Names YAML of the prediction indices if they are
+            not already hierarchy indices; they are remapped (unmapped ones dropped).
+        workers (int): Processes matching images in parallel.
+
+    Returns:
+        dict: Per-node AP50 / AP50-95 with GT counts and depth, plus per-level means.
+    """
+    names = load_names(names_yaml)
+    with open(class_dag_yaml, "r") as f:
+        ancestors = build_ancestor_table(yaml.safe_load(f)["class_dag"], names)
+    pred_map = compile_label_mapping(pred_names_yaml, names_yaml) if pred_names_yaml else None
+
+    stems = sorted({os.path.splitext(f)[0] for d in (gt_dir, pred_dir) for f in os.listdir(d) if f.endswith(".txt")})
+    jobs = [(os.path.join(gt_dir, f"{s}.txt"), os.path.join(pred_dir, f"{s}.txt"), ancestors, pred_map) for s in stems]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_match_image_job, jobs, chunksize=256))
+
+    node = np.concatenate([r[0] for r in results]) if results else np.zeros(0, dtype=np.int64)
+    score = np.concatenate([r[1] for r in results]) if results else np.zeros(0)
+    tp = np.concatenate([r[2] for r in results], axis=1) if results else np.zeros((len(IOU_THRESHOLDS), 0), bool)
+    n_gt = np.sum([r[3] for r in results], axis=0) if results else np.zeros(len(names), dtype=np.int64)
+
+    depth = ancestors.sum(axis=1) - 1
+    is_leaf = ancestors.sum(axis=0) == 1
+    order = np.argsort(node, kind="stable")
+    node, score, tp = node[order], score[order], tp[:, order]
+    bounds = np.searchsorted(node, np.arange(len(names) + 1))
+
+    per_node = {}
+    for c, name in enumerate(names):
+        if not name:
+            continue  # gap in the names YAML's indices
+        lo, hi = bounds[c], bounds[c + 1]
+        ap = average_precision(tp[:, lo:hi], score[lo:hi], int(n_gt[c]))
+        per_node[name] = {
+            "depth": int(depth[c]),
+            "leaf": bool(is_leaf[c]),
+            "n_gt": int(n_gt[c]),
+            "AP50": None if np.isnan(ap[0]) else float(ap[0]),
+            "AP50_95": None if np.isnan(ap).all() else float(np.nanmean(ap)),
+        }
+
+    def level_mean(selected):
+        values = [per_node[n]["AP50_95"] for n in selected if per_node[n]["AP50_95"] is not None]
+        return float(np.mean(values)) if values else None
+
+    levels = {"leaf": level_mean([n for n in per_node if per_node[n]["leaf"]])}
+    for d in sorted({result["depth"] for result in per_node.values()}):
+        levels[f"depth_{d}"] = level_mean([n for n in per_node if per_node[n]["depth"] == d])
+
+    return {"images": len(stems), "levels": levels, "nodes": per_node}
+
+if __name__ == "__main__":
+    report = evaluate_hierarchy(GT_LABEL_DIR, PRED_LABEL_DIR, NAMES_YAML, CLASS_DAG_YAML, PRED_NAMES_YAML)
+
+    for name, result in report["nodes"].items():
+        ap = result["AP50_95"]
+        print(f"{'  ' * result['depth']}{name}: mAP50-95 {'n/a' if ap is None else f'{ap:.3f}'} (n_gt {result['n_gt']})")
+    for level, ap in report["levels"].items():
+        print(f"{level}: {'n/a' if ap is None else f'{ap:.3f}'}")
+
+    os.makedirs(os.path.dirname(REPORT_PATH) or ".", exist_ok=True)
+    with open(REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Hierarchy evaluation saved to {REPORT_PATH}")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+import os
+import io
+import json
+import random
+import tarfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# Images and labels to pack (YOLO or class-hierarchy labels, after conversion)
+IMAGE_DIR = "yolo_format/class_hierarchy/train/images"
+LABEL_DIR = "yolo_format/class_hierarchy/train/labels"
+SHARD_DIR = "yolo_format/class_hierarchy/train/shards"
+
+SAMPLES_PER_SHARD = 1000  # images per tar shard
+SHUFFLE_SEED = 0          # fixed so any single shard can be rebuilt identically
+WORKERS = os.cpu_count()  # shards written in parallel
+SHARDS_TO_BUILD = None    # e.g. [17] to rebuild only shard 17; None builds all
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+INDEX_FILE = "index.json"
+
+def list_samples(image_dir, label_dir):
+    """
+    List (key, image_path, label_path) for every image, sorted by key.
+    label_path is None for images without a label file.
+    """
+    samples = []
+    for image_path in sorted(Path(image_dir).iterdir()):
+        if image_path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        label_path = Path(label_dir) / f"{image_path.stem}.txt"
+        samples.append((image_path.stem, str(image_path), str(label_path) if label_path.is_file() else None))
+    return samples
+
+def plan_shards(samples, samples_per_shard=SAMPLES_PER_SHARD, seed=SHUFFLE_SEED):
+    """Shuffle the samples with a fixed seed and cut them into shards of equal size."""
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    return [samples[i:i + samples_per_shard] for i in range(0, len(samples), samples_per_shard)]
+
+def shard_name(shard_id):
+    return f"shard-{shard_id:06d}.tar"
+
+def add_bytes(tar, name, data):
+    """Add an in-memory file with fixed metadata so rebuilt shards are byte-identical."""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+def write_shard(shard_path, samples):
+    """
+    Write one WebDataset-style shard: <key><image ext> followed by <key>.txt
+    for every sample (an empty .txt for images without labels). The shard is
+    written to a temporary file and renamed, so readers never see a partial shard.
+
+    Returns:
+        dict: Index entry for the shard.
+    """
+    tmp_path = shard_path + ".tmp"
+    with tarfile.open(tmp_path, "w", format=tarfile.USTAR_FORMAT) as tar:
+        for key, image_path, label_path in samples:
+            with open(image_path, "rb") as f:
+                add_bytes(tar, key + os.path.splitext(image_path)[1].lower(), f.read())
+            label = b""
+            if label_path is not None:
+                with open(label_path, "rb") as f:
+                    label = f.read()
+            add_bytes(tar, key + ".txt", label)
+    os.replace(tmp_path, shard_path)
+    return {
+        "name": os.path.basename(shard_path),
+        "num_samples": len(samples),
+        "bytes": os.path.getsize(shard_path),
+        "keys": [key for key, _, _ in samples],
+    }
+
+def _write_shard_job(job):
+    shard_path, samples = job
+    entry = write_shard(shard_path, samples)
+    print(f"Wrote {entry['name']} ({entry['num_samples']} samples, {entry['bytes']} bytes)")
+    return entry
+
+def export_shards(image_dir, label_dir, shard_dir, samples_per_shard=SAMPLES_PER_SHARD,
+                  seed=SHUFFLE_SEED, workers=WORKERS, shard_ids=None):
+    """
+    Pack images and labels into shuffled tar shards plus an index.json.
+
+    Parameters:
+        image_dir (str): Directory of images.
+        label_dir (str): Directory of YOLO label files.
+        shard_dir (str): Output directory for the shards and index.
+        samples_per_shard (int): Images per shard.
+        seed (int): Shuffle seed; the shard plan is deterministic given the inputs.
+        workers (int): Processes writing shards in parallel.
+        shard_ids (list): Only (re)build these shards; None builds all of them.
+
+    Returns:
+        dict: The shard index.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = plan_shards(list_samples(image_dir, label_dir), samples_per_shard, seed)
+    if shard_ids is None:
+        shard_ids = range(len(shards))
+    shard_ids = [i for i in shard_ids if 0 <= i < len(shards)]
+
+    jobs = [(os.path.join(shard_dir, shard_name(i)), shards[i]) for i in shard_ids]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        entries = dict(zip(shard_ids, pool.map(_write_shard_job, jobs)))
+
+    # Merge into the existing index when only some shards were rebuilt
+    index_path = os.path.join(shard_dir, INDEX_FILE)
+    index = {"samples_per_shard": samples_per_shard, "seed": seed, "shards": [None] * len(shards)}
+    if os.path.isfile(index_path):
+        with open(index_path, "r") as f:
+            previous = json.load(f)
+        if (previous.get("samples_per_shard"), previous.get("seed"), len(previous.get("shards", []))) == \
+                (samples_per_shard, seed, len(shards)):
+            index["shards"] = previous["shards"]
+    for i, entry in entries.items():
+        index["shards"][i] = entry
+    index["num_samples"] = sum(len(s) for s in shards)
+
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+    print(f"Shard index saved to {index_path}")
+    return index
+
+if __name__ == "__main__":
+    export_shards(IMAGE_DIR, LABEL_DIR, SHARD_DIR, shard_ids=SHARDS_TO_BUILD)
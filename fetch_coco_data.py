@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+import os
+import json
+import shutil
+import hashlib
+import zipfile
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# Where the archives come from and where they are unpacked
+COCO_BASE_URL = "http://images.cocodataset.org/"
+COCO_DATA_DIR = "/data/naddeok/coco/"
+
+# (archive path relative to COCO_BASE_URL, directory it is extracted into relative
+# to COCO_DATA_DIR). Annotations come first so conversion can start early.
+COCO_ARCHIVES = [
+    ("annotations/annotations_trainval2017.zip", "."),
+    ("zips/val2017.zip", "images"),
+    ("zips/train2017.zip", "images"),
+    ("zips/test2017.zip", "images"),
+    ("zips/unlabeled2017.zip", "images"),
+    ("annotations/stuff_annotations_trainval2017.zip", "."),
+    ("annotations/image_info_test2017.zip", "."),
+    ("annotations/image_info_unlabeled2017.zip", "."),
+]
+
+# Optional sha256 per archive file name, e.g. {"val2017.zip": "..."}. Archives
+# listed here are verified after download; the rest are checked by size only
+# and a warning is printed. COCO does not publish digests, so pin the ones of a
+# download you trust here.
+COCO_CHECKSUMS = {}
+
+CHUNK_SIZE = 64 * 1024 * 1024  # bytes per ranged request
+DOWNLOAD_WORKERS = 8            # concurrent ranged requests across all archives
+EXTRACT_WORKERS = 2             # archives extracted at the same time
+CONVERT_ANNOTATIONS = True      # run the YOLO conversion as soon as annotations land
+# Image links and ultralytics label caches of a split can only be made once its
+# images are on disk, so they wait for these archives to be extracted
+ANNOTATIONS_ARCHIVE = "annotations_trainval2017.zip"
+IMAGE_ARCHIVE_SPLITS = {"train2017.zip": "train", "val2017.zip": "val"}
+YOLO_SUBDIR = "yolo_format"     # labels are written to <data_dir>/yolo_format
+
+_session_local = threading.local()
+_split_streams = {}  # (data_dir, split) -> normalized annotation stream, until its images land
+
+def get_session():
+    """One requests.Session per thread (sessions are not thread-safe)."""
+    if not hasattr(_session_local, "session"):
+        _session_local.session = requests.Session()
+    return _session_local.session
+
+def probe_url(url):
+    """
+    Ask the server for the size of a file and whether it serves byte ranges.
+
+    Returns:
+        tuple: (size in bytes or None, accepts_ranges)
+    """
+    response = get_session().head(url, allow_redirects=True, timeout=30)
+    response.raise_for_status()
+    size = response.headers.get("Content-Length")
+    accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return (int(size) if size is not None else None), accepts_ranges
+
+def sha256_file(path, block_size=1024 * 1024):
+    """Stream a file through sha256 and return the hex digest."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class ChunkProgress:
+    """
+    Set of finished chunk indices for one partial download, persisted to a
+    small JSON sidecar so an interrupted download resumes where it stopped.
+    """
+
+    def __init__(self, path, size, chunk_size):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                state = json.load(f)
+            if state.get("size") == size and state.get("chunk_size") == chunk_size:
+                self.done = set(state["done"])
+        self.size = size
+        self.chunk_size = chunk_size
+
+    def reset(self):
+        """Forget every finished chunk (the partial file they were in is gone)."""
+        with self.lock:
+            self.done = set()
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+
+    def mark_done(self, index):
+        with self.lock:
+            self.done.add(index)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"size": self.size, "chunk_size": self.chunk_size, "done": sorted(self.done)}, f)
+            os.replace(tmp_path, self.path)
+
+def download_range(url, part_path, start, end):
+    """Download bytes [start, end] of url into the same offsets of part_path."""
+    headers = {"Range": f"bytes={start}-{end}"}
+    with get_session().get(url, headers=headers, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise IOError(f"Server ignored the range request for {url}")
+        with open(part_path, "r+b") as f:
+            f.seek(start)
+            for block in response.iter_content(chunk_size=1024 * 1024):
+                f.write(block)
+            if f.tell() != end + 1:
+                raise IOError(f"Short read for {url} bytes {start}-{end}")
+
+def download_whole(url, part_path):
+    """Plain streaming download, used when the server does not serve ranges."""
+    with get_session().get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(part_path, "wb") as f:
+            for block in response.iter_content(chunk_size=1024 * 1024):
+                f.write(block)
+
+def download_file(url, dest_path, chunk_pool, chunk_size=CHUNK_SIZE, checksum=None):
+    """
+    Download url to dest_path with concurrent ranged requests, resuming any
+    chunks finished by an earlier run, and verify it before moving it into place.
+
+    Parameters:
+        url (str): File to download.
+        dest_path (str): Final location of the file.
+        chunk_pool (ThreadPoolExecutor): Pool the ranged requests run on.
+        chunk_size (int): Bytes per ranged request.
+        checksum (str): Optional expected sha256 hex digest.
+
+    Returns:
+        str: dest_path.
+    """
+    size, accepts_ranges = probe_url(url)
+    if os.path.isfile(dest_path) and (size is None or os.path.getsize(dest_path) == size):
+        return dest_path
+
+    part_path = dest_path + ".part"
+    progress_path = dest_path + ".progress"
+
+    if accepts_ranges and size:
+        progress = ChunkProgress(progress_path, size, chunk_size)
+        if os.path.isfile(part_path) and progress.done:
+            mode = "r+b"
+        else:
+            # The partial file is (re)created empty, so no chunk of it is done
+            progress.reset()
+            mode = "wb"
+        with open(part_path, mode) as f:
+            f.truncate(size)
+
+        def fetch_chunk(index):
+            start = index * chunk_size
+            download_range(url, part_path, start, min(start + chunk_size, size) - 1)
+            progress.mark_done(index)
+
+        n_chunks = -(-size // chunk_size)
+        todo = [i for i in range(n_chunks) if i not in progress.done]
+        for future in [chunk_pool.submit(fetch_chunk, i) for i in todo]:
+            future.result()
+    else:
+        download_whole(url, part_path)
+
+    # Verify size and (if known) checksum before the file is considered complete
+    if size is not None and os.path.getsize(part_path) != size:
+        raise IOError(f"{url}: expected {size} bytes, got {os.path.getsize(part_path)}")
+    if checksum and sha256_file(part_path) != checksum.lower():
+        os.remove(part_path)
+        if os.path.isfile(progress_path):
+            os.remove(progress_path)
+        raise IOError(f"{url}: sha256 mismatch, partial download discarded")
+    if not checksum:
+        print(f"WARNING: no sha256 known for {os.path.basename(dest_path)}, only its size was verified")
+
+    os.replace(part_path, dest_path)
+    if os.path.isfile(progress_path):
+        os.remove(progress_path)
+    return dest_path
+
+def extract_members(zip_path, output_dir):
+    """
+    Extract a zip member by member, streaming each one to disk. Members that
+    already exist with the right size (from an interrupted run) are skipped.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            target = os.path.realpath(os.path.join(output_dir, member.filename))
+            if not target.startswith(os.path.realpath(output_dir) + os.sep):
+                raise ValueError(f"{zip_path}: refusing to extract {member.filename} outside {output_dir}")
+            if member.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            if os.path.isfile(target) and os.path.getsize(target) == member.file_size:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with archive.open(member) as src, open(target + ".part", "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(target + ".part", target)
+
+def extract_archive(zip_path, output_dir, remove=True):
+    """
+    Extract a zip with extract_members, then delete it if remove. A corrupt
+    archive (bad zip or CRC) is deleted so the next run downloads it again.
+    """
+    try:
+        extract_members(zip_path, output_dir)
+    except zipfile.BadZipFile:
+        os.remove(zip_path)
+        raise
+    if remove:
+        os.remove(zip_path)
+    print(f"Extracted {zip_path} -> {output_dir}")
+
+def yolo_variants(data_dir):
+    """
+    The converter's LABEL_VARIANTS with their output dirs moved from
+    converter.YOLO_OUTPUT_DIR to <data_dir>/YOLO_SUBDIR.
+    """
+    import convert_coco_2_yolo_format as converter
+
+    yolo_dir = os.path.join(data_dir, YOLO_SUBDIR)
+    return [
+        dict(variant, output_dir=os.path.normpath(
+            os.path.join(yolo_dir, os.path.relpath(variant["output_dir"], converter.YOLO_OUTPUT_DIR))
+        ))
+        for variant in converter.LABEL_VARIANTS
+    ]
+
+def convert_split(data_dir, split):
+    """
+    Write the YOLO labels of one split and keep its normalized stream until
+    prepare_split_images links the images and writes the label caches.
+    """
+    import convert_coco_2_yolo_format as converter
+
+    stream, _ = converter.convert_coco_to_yolo_variants(
+        os.path.join(data_dir, "annotations", f"instances_{split}2017.json"),
+        os.path.join(data_dir, "images", f"{split}2017"),
+        yolo_variants(data_dir),
+        split,
+        skip_crowd=converter.SKIP_CROWD,
+        min_area=converter.MIN_AREA,
+        label_format=converter.LABEL_FORMAT,
+    )
+    _split_streams[(data_dir, split)] = stream
+
+def convert_annotations(data_dir):
+    """Run the YOLO label conversion for train/val from the freshly extracted annotations."""
+    import convert_coco_2_yolo_format as converter
+
+    for split in ["train", "val"]:
+        convert_split(data_dir, split)
+    if converter.WRITE_ULTRALYTICS_FILES:
+        for variant in yolo_variants(data_dir):
+            converter.write_dataset_yaml(variant)
+    print("Conversion to YOLO format completed successfully!")
+
+def prepare_split_images(data_dir, split):
+    """
+    Link a split's freshly extracted images and write its ultralytics label
+    caches from the stream kept by convert_annotations; the label files it
+    already wrote are left untouched (only reloaded if no stream was kept).
+    """
+    import convert_coco_2_yolo_format as converter
+
+    if not (converter.LINK_IMAGES or converter.WRITE_ULTRALYTICS_FILES):
+        return
+    stream = _split_streams.pop((data_dir, split), None)
+    if stream is None:
+        stream = converter.normalize_annotations(
+            converter.load_coco_annotations(os.path.join(data_dir, "annotations", f"instances_{split}2017.json")),
+            skip_crowd=converter.SKIP_CROWD,
+            min_area=converter.MIN_AREA,
+            polygons=(converter.LABEL_FORMAT == "polygon"),
+        )
+    image_dir = os.path.join(data_dir, "images", f"{split}2017")
+    for variant in yolo_variants(data_dir):
+        converter.finish_variant(
+            stream, variant, split, image_dir,
+            ultralytics=converter.WRITE_ULTRALYTICS_FILES,
+            link=converter.LINK_IMAGES,
+        )
+    print(f"Images linked and label caches written for {split}")
+
+def fetch_coco(base_url=COCO_BASE_URL, data_dir=COCO_DATA_DIR, archives=COCO_ARCHIVES,
+               checksums=COCO_CHECKSUMS, chunk_size=CHUNK_SIZE, on_annotations=None, on_images=None):
+    """
+    Download and extract every archive as a pipeline: all archives download
+    concurrently (as ranged chunks), each is extracted as soon as it is
+    complete while the others keep downloading, and on_annotations(data_dir)
+    is started as soon as annotations_trainval2017.zip has been extracted.
+    on_images(data_dir, split) runs once a split's image archive and the
+    annotations are both extracted, always after on_annotations. Archives
+    already extracted by an earlier run count as extracted, so a rerun
+    finishes any step an interrupted run did not get to.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    base_url = base_url.rstrip("/") + "/"
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as chunk_pool, \
+            ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as extract_pool, \
+            ThreadPoolExecutor(max_workers=len(archives)) as archive_pool, \
+            ThreadPoolExecutor(max_workers=1) as convert_pool:
+        convert_futures = []
+        extracted = set()
+        lock = threading.Lock()
+
+        def after_extract(file_name):
+            # convert_pool has a single worker, so submitting under the lock
+            # keeps on_annotations ahead of every on_images call
+            with lock:
+                extracted.add(file_name)
+                if ANNOTATIONS_ARCHIVE not in extracted:
+                    return
+                if file_name == ANNOTATIONS_ARCHIVE:
+                    if on_annotations is not None:
+                        convert_futures.append(convert_pool.submit(on_annotations, data_dir))
+                    ready = [name for name in extracted if name in IMAGE_ARCHIVE_SPLITS]
+                else:
+                    ready = [file_name] if file_name in IMAGE_ARCHIVE_SPLITS else []
+                if on_images is not None:
+                    for name in ready:
+                        convert_futures.append(convert_pool.submit(on_images, data_dir, IMAGE_ARCHIVE_SPLITS[name]))
+
+        def fetch_one(archive, subdir):
+            file_name = os.path.basename(archive)
+            output_dir = os.path.join(data_dir, subdir)
+            os.makedirs(output_dir, exist_ok=True)
+
+            # Marker left after a successful extraction, so reruns skip the archive
+            done_marker = os.path.join(output_dir, f".{file_name}.extracted")
+            if os.path.isfile(done_marker):
+                print(f"Skipping {file_name}, already extracted")
+                after_extract(file_name)
+                return
+
+            zip_path = download_file(
+                base_url + archive,
+                os.path.join(output_dir, file_name),
+                chunk_pool,
+                chunk_size=chunk_size,
+                checksum=checksums.get(file_name),
+            )
+            print(f"Downloaded {file_name}")
+            extract_pool.submit(extract_archive, zip_path, output_dir).result()
+            open(done_marker, "w").close()
+            after_extract(file_name)
+
+        futures = [archive_pool.submit(fetch_one, archive, subdir) for archive, subdir in archives]
+        for future in futures:
+            future.result()
+        for future in convert_futures:
+            future.result()
+
+if __name__ == "__main__":
+    fetch_coco(
+        on_annotations=convert_annotations if CONVERT_ANNOTATIONS else None,
+        on_images=prepare_split_images if CONVERT_ANNOTATIONS else None,
+    )
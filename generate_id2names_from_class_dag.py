@@ -1,3 +1,4 @@
+import numpy as np
 import yaml
 def depth_first_traversal(dag):
     """Perform a depth-first traversal of the class DAG."""
@@ -22,6 +23,45 @@ def depth_first_traversal(dag):
     dfs(dag)
     return names
 
+def collect_ancestors(dag):
+    """Map every node of the class DAG (internal or leaf) to its list of ancestors, root first."""
+    ancestors = {}
+
+    def dfs(node, chain):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                ancestors[key] = chain
+                dfs(value, chain + [key])
+        elif isinstance(node, list):
+            for item in node:
+                if isinstance(item, dict):
+                    dfs(item, chain)  # nested dictionary, same parent chain
+                else:
+                    ancestors[item] = chain
+
+    dfs(dag, [])
+    return ancestors
+
+def build_ancestor_table(dag, names):
+    """
+    Compile the class DAG into a dense boolean table over the given names
+    (index -> name, e.g. from id2names_class_hierarchy.yaml).
+
+    table[c, a] is True when class a is class c itself or one of its ancestors,
+    so table[labels] gives every box's ancestor mask in one lookup.
+    """
+    if isinstance(names, dict):
+        names = [names[k] for k in sorted(names)]
+    index = {name: i for i, name in enumerate(names)}
+    table = np.eye(len(names), dtype=bool)
+    for name, chain in collect_ancestors(dag).items():
+        if name not in index:
+            continue
+        for ancestor in chain:
+            if ancestor in index:
+                table[index[name], index[ancestor]] = True
+    return table
+
 def process_yaml(input_path, output_path):
     """Reads class_dag from YAML, processes it via DFS, and writes output YAML."""
     with open(input_path, 'r') as file:
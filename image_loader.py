@@ -0,0 +1,79 @@
+import cv2
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# cv2 decode flags by downscale factor; JPEG decodes these straight from the
+# DCT coefficients, so a 1/4 decode costs a fraction of a full one.
+REDUCED_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def read_image_size(image_path):
+    """
+    Read (width, height) from the image header without decoding the pixels.
+    Returns None if the file cannot be opened.
+    """
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except OSError:
+        return None
+
+def reduction_factor(image_size, target_size):
+    """
+    Pick the largest decode factor (1, 2, 4 or 8) that still leaves the
+    longer image side at least target_size pixels.
+    """
+    if image_size is None or not target_size:
+        return 1
+    longest = max(image_size)
+    factor = 1
+    for candidate in sorted(REDUCED_READ_FLAGS):
+        if longest / candidate >= target_size:
+            factor = candidate
+    return factor
+
+def load_image_reduced(image_path, target_size=None):
+    """
+    Load an image as RGB, decoded at reduced resolution when target_size allows it.
+
+    YOLO labels are normalized, so boxes drawn from the returned array's own
+    width/height line up with the downscaled image automatically.
+
+    Parameters:
+        image_path (str or Path): Path to the image.
+        target_size (int): Longest side (pixels) the image will be shown at;
+            None decodes at full resolution.
+
+    Returns:
+        numpy.ndarray: The RGB image, or None if it could not be read.
+    """
+    factor = reduction_factor(read_image_size(image_path), target_size)
+    image_bgr = cv2.imread(str(image_path), REDUCED_READ_FLAGS[factor])
+    if image_bgr is None:
+        return None
+    return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+
+def prefetch_images(image_paths, target_size=None, prefetch=4, workers=2):
+    """
+    Yield load_image_reduced(path) for each path, in order, while the next
+    `prefetch` images are decoded on background threads (cv2 releases the
+    GIL while decoding, so this overlaps with the caller's rendering).
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        paths = iter(image_paths)
+        for path in paths:
+            pending.append(pool.submit(load_image_reduced, path, target_size))
+            if len(pending) > prefetch:
+                break
+        while pending:
+            image = pending.popleft().result()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append(pool.submit(load_image_reduced, next_path, target_size))
+            yield image
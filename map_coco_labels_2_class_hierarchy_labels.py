@@ -1,6 +1,12 @@
 import os
+import hashlib
+import numpy as np
 import yaml
 
+# What to do with a label whose class has no counterpart in the new YAML:
+#   "error" -> raise, "drop" -> remove the box, "keep" -> write the old index unchanged
+UNMAPPED_POLICIES = ("error", "drop", "keep")
+
 def load_labels(yaml_path):
     """
     Loads label mappings from a YAML file (index -> name).
@@ -12,34 +18,187 @@ def load_labels(yaml_path):
     if "names" not in data:
         raise ValueError(f"The YAML file {yaml_path} must contain a 'names' key.")
 
-    # data["names"] is index -> string; invert that to string -> index
+    # data["names"] is index -> string (or a list in index order); invert that to string -> index
+    names = data["names"]
     name_to_index = {}
-    for idx, label_name in data["names"].items():
+    for idx, label_name in (names.items() if isinstance(names, dict) else enumerate(names)):
         idx = int(idx)  # ensure numeric index
         # Use the label name as-is (no underscores) since you've fixed them
         name_to_index[label_name] = idx
 
     return name_to_index
 
-def create_label_mapping(original_yaml, new_yaml):
+def load_names(yaml_path):
     """
-    Creates a mapping of old_label_index -> new_label_index
-    by matching label names from two YAML files.
+    Loads the 'names' of a YAML file as a dense list (index -> name).
+    Indices missing from the YAML are left as empty strings.
     """
-    original_labels = load_labels(original_yaml)  # label_name -> old_index
-    new_labels = load_labels(new_yaml)            # label_name -> new_index
-
-    label_mapping = {}
-    for label_name, old_idx in original_labels.items():
-        # only map if the label name exists in the new labels
-        if label_name in new_labels:
-            new_idx = new_labels[label_name]
-            label_mapping[old_idx] = new_idx
-    return label_mapping
-
-def process_label_files(label_dir, output_dir, label_mapping):
+    name_to_index = load_labels(yaml_path)
+    names = [""] * (max(name_to_index.values(), default=-1) + 1)
+    for label_name, idx in name_to_index.items():
+        names[idx] = label_name
+    return names
+
+def hash_files(*paths):
+    """Returns a sha256 hex digest over the contents of the given files."""
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+class LabelMapping:
+    """
+    Compiled old_label_index -> new_label_index mapping between two names YAMLs.
+
+    forward[old] is the new index (-1 if the class is unmapped) and
+    reverse[new] is the old index (-1 if the class is an orphan, e.g. an
+    internal hierarchy node that no original label maps onto).
+    """
+
+    def __init__(self, forward, reverse, old_names, new_names, source_hash):
+        self.forward = np.asarray(forward, dtype=np.int64)
+        self.reverse = np.asarray(reverse, dtype=np.int64)
+        self.old_names = list(old_names)
+        self.new_names = list(new_names)
+        self.source_hash = str(source_hash)
+        self.unmapped = {self.old_names[i] for i in np.flatnonzero(self.forward < 0) if self.old_names[i]}
+        self.orphans = {self.new_names[i] for i in np.flatnonzero(self.reverse < 0) if self.new_names[i]}
+
+    @classmethod
+    def from_yamls(cls, original_yaml, new_yaml):
+        """Builds the mapping by matching label names from two YAML files."""
+        old_names = load_names(original_yaml)
+        new_labels = load_labels(new_yaml)  # label_name -> new_index
+        new_names = load_names(new_yaml)
+
+        forward = np.full(len(old_names), -1, dtype=np.int64)
+        reverse = np.full(len(new_names), -1, dtype=np.int64)
+        for old_idx, label_name in enumerate(old_names):
+            # only map if the label name exists in the new labels
+            if label_name and label_name in new_labels:
+                forward[old_idx] = new_labels[label_name]
+                reverse[new_labels[label_name]] = old_idx
+        return cls(forward, reverse, old_names, new_names, hash_files(original_yaml, new_yaml))
+
+    def save(self, path):
+        """
+        Saves the compiled arrays to a small .npz cache file, atomically so an
+        interrupted run never leaves a truncated cache behind.
+        """
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                forward=self.forward,
+                reverse=self.reverse,
+                old_names=np.array(self.old_names, dtype=str),
+                new_names=np.array(self.new_names, dtype=str),
+                source_hash=np.array(self.source_hash),
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a mapping previously written with save()."""
+        with np.load(path, allow_pickle=False) as cache:
+            return cls(
+                cache["forward"],
+                cache["reverse"],
+                cache["old_names"].tolist(),
+                cache["new_names"].tolist(),
+                cache["source_hash"].item(),
+            )
+
+    def remap(self, labels, policy="error"):
+        """
+        Maps an array of old indices to new indices according to policy.
+
+        Returns:
+            tuple: (new_labels, keep) where keep marks the boxes to write.
+        """
+        if policy not in UNMAPPED_POLICIES:
+            raise ValueError(f"Unknown unmapped-label policy '{policy}', expected one of {UNMAPPED_POLICIES}.")
+
+        labels = np.asarray(labels, dtype=np.int64)
+        in_range = (labels >= 0) & (labels < len(self.forward))
+        new_labels = np.full(labels.shape, -1, dtype=np.int64)
+        new_labels[in_range] = self.forward[labels[in_range]]
+        mapped = new_labels >= 0
+
+        if policy == "error" and not mapped.all():
+            bad = sorted(set(labels[~mapped].tolist()))
+            raise ValueError(f"Labels {bad} have no counterpart in the new label set.")
+        if policy == "keep":
+            new_labels = np.where(mapped, new_labels, labels)
+            return new_labels, np.ones(labels.shape, dtype=bool)
+        return new_labels, mapped
+
+    def as_dict(self):
+        """Returns the mapping as the plain {old_index: new_index} dict."""
+        return {old_idx: int(new_idx) for old_idx, new_idx in enumerate(self.forward) if new_idx >= 0}
+
+def default_mapping_cache_path(original_yaml, new_yaml):
+    """Cache file next to the new YAML, e.g. id2names_class_hierarchy.from_id2names.mapping.npz."""
+    old_stem = os.path.splitext(os.path.basename(original_yaml))[0]
+    return f"{os.path.splitext(new_yaml)[0]}.from_{old_stem}.mapping.npz"
+
+def compile_label_mapping(original_yaml, new_yaml, cache_path=None):
+    """
+    Returns the compiled LabelMapping for two YAML files, reusing the cached
+    artifact unless either YAML has changed since it was written.
+    """
+    if cache_path is None:
+        cache_path = default_mapping_cache_path(original_yaml, new_yaml)
+
+    source_hash = hash_files(original_yaml, new_yaml)
+    if os.path.isfile(cache_path):
+        try:
+            mapping = LabelMapping.load(cache_path)
+            if mapping.source_hash == source_hash:
+                return mapping
+        except Exception:
+            pass  # unreadable (e.g. truncated or empty) or outdated cache, rebuild it below
+
+    mapping = LabelMapping.from_yamls(original_yaml, new_yaml)
+    mapping.save(cache_path)
+    return mapping
+
+def remap_label_rows(rows, label_mapping, policy="error", source=None):
+    """
+    Remaps the class index (first field) of split YOLO label rows.
+    Labels without a new index are handled according to policy (see UNMAPPED_POLICIES).
+
+    Returns:
+        list: (new_label, parts) for every row that is kept.
+    """
+    try:
+        new_labels, keep = label_mapping.remap([int(parts[0]) for parts in rows], policy)
+    except ValueError as e:
+        raise ValueError(f"{source}: {e}" if source else str(e)) from None
+    return [(new_label, parts) for parts, new_label, kept in zip(rows, new_labels.tolist(), keep.tolist()) if kept]
+
+def remap_label_file(input_file, output_file, label_mapping, policy="error"):
+    """
+    Rewrites one YOLO label file with new indices.
+    Labels without a new index are handled according to policy (see UNMAPPED_POLICIES).
+    """
+    with open(input_file, "r") as f_in:
+        rows = [line.split() for line in f_in]
+    rows = [parts for parts in rows if parts]
+
+    updated_lines = [
+        " ".join([str(new_label)] + parts[1:])
+        for new_label, parts in remap_label_rows(rows, label_mapping, policy, input_file)
+    ]
+
+    # Save the updated lines to the new file
+    with open(output_file, "w") as f_out:
+        f_out.write("\n".join(updated_lines) + "\n")
+
+def process_label_files(label_dir, output_dir, label_mapping, policy="error"):
     """
     Processes YOLO label files (.txt), replacing old indices with new indices.
+    Labels without a new index are handled according to policy (see UNMAPPED_POLICIES).
     """
     os.makedirs(output_dir, exist_ok=True)
 
@@ -47,25 +206,7 @@ def process_label_files(label_dir, output_dir, label_mapping):
         if filename.endswith(".txt"):
             input_file = os.path.join(label_dir, filename)
             output_file = os.path.join(output_dir, filename)
-
-            with open(input_file, "r") as f_in:
-                lines = f_in.readlines()
-
-            updated_lines = []
-            for line in lines:
-                parts = line.strip().split()
-                if len(parts) > 0:
-                    old_label = int(parts[0])
-                    # If there's a mapping for this old_label, replace it
-                    if old_label in label_mapping:
-                        new_label = label_mapping[old_label]
-                        parts[0] = str(new_label)
-                    # Otherwise, keep the old label or skip it (depends on your preference)
-                    updated_lines.append(" ".join(parts))
-
-            # Save the updated lines to the new file
-            with open(output_file, "w") as f_out:
-                f_out.write("\n".join(updated_lines) + "\n")
+            remap_label_file(input_file, output_file, label_mapping, policy)
 
     print(f"Processed labels saved to {output_dir}")
 
@@ -75,7 +216,10 @@ if __name__ == "__main__":
     new_yaml = "id2names_class_hierarchy.yaml"       # <-- new YAML path
     label_dir = "yolo_format/train/labels"           # <-- directory of original .txt files
     output_dir = "yolo_format/class_hierarchy/train/labels"  # <-- output directory for remapped .txt
+    policy = "error"                                 # <-- one of UNMAPPED_POLICIES
 
-    # Create the mapping and process the label files
-    mapping = create_label_mapping(original_yaml, new_yaml)
-    process_label_files(label_dir, output_dir, mapping)
+    # Load the compiled mapping (rebuilt only when a YAML changes) and process the label files
+    mapping = compile_label_mapping(original_yaml, new_yaml)
+    if mapping.unmapped:
+        print(f"Classes without a counterpart in {new_yaml}: {sorted(mapping.unmapped)}")
+    process_label_files(label_dir, output_dir, mapping, policy)
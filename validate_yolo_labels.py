@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+import os
+import json
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from map_coco_labels_2_class_hierarchy_labels import load_names
+
+# Labels to check and the names YAML their class ids refer to
+LABEL_DIR = "yolo_format/train/labels"
+NAMES_YAML = "id2names.yaml"
+REPORT_PATH = "yolo_format/train/label_report.json"
+
+FIX = False               # write repaired label files
+FIXED_LABEL_DIR = None    # where repaired files go; None repairs LABEL_DIR in place
+MIN_SIZE = 1e-4           # boxes narrower/shorter than this (normalized) are degenerate
+DUPLICATE_IOU = 0.95      # same-class boxes overlapping at least this much are duplicates
+FILES_PER_SHARD = 5000    # label files validated per worker task
+WORKERS = os.cpu_count()
+
+ISSUES = ("malformed_line", "bad_class", "out_of_range", "degenerate", "duplicate")
+
+def load_valid_classes(names_yaml):
+    """Dense bool array: valid[c] is True when class id c is in the names YAML."""
+    return np.array([bool(name) for name in load_names(names_yaml)], dtype=bool)
+
+def read_label_files(label_paths):
+    """
+    Load a batch of label files into flat arrays.
+
+    Returns:
+        tuple: (rows (N, 5) float64, file_idx (N,) which file each row came from,
+        lines (list of the original text of each row), malformed (per-file count
+        of lines that are neither 5 finite numbers nor a polygon), polygons
+        (list of (file index, split fields) for YOLO-seg polygon lines)).
+    """
+    tokens, file_idx, lines, polygons = [], [], [], []
+    malformed = np.zeros(len(label_paths), dtype=np.int64)
+    for i, label_path in enumerate(label_paths):
+        with open(label_path, "r") as lf:
+            for line in lf:
+                parts = line.split()
+                if not parts:
+                    continue
+                if len(parts) >= 7 and len(parts) % 2 == 1:
+                    # YOLO-seg line: class followed by at least 3 x, y pairs
+                    polygons.append((i, parts))
+                    continue
+                if len(parts) != 5:
+                    malformed[i] += 1
+                    continue
+                tokens.append(parts)
+                file_idx.append(i)
+                lines.append(line.strip())
+    try:
+        rows = np.array(tokens, dtype=np.float64).reshape(-1, 5)
+    except ValueError:
+        # Fall back to row by row to isolate non-numeric lines
+        rows, keep = [], []
+        for parts in tokens:
+            try:
+                rows.append([float(p) for p in parts])
+                keep.append(True)
+            except ValueError:
+                keep.append(False)
+        for i, ok in zip(file_idx, keep):
+            malformed[i] += not ok
+        file_idx = [i for i, ok in zip(file_idx, keep) if ok]
+        lines = [line for line, ok in zip(lines, keep) if ok]
+        rows = np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+    # NaN/inf fail every comparison below, so they would pass every check
+    file_idx = np.array(file_idx, dtype=np.int64)
+    finite = np.isfinite(rows).all(axis=1)
+    if not finite.all():
+        np.add.at(malformed, file_idx[~finite], 1)
+        rows, file_idx = rows[finite], file_idx[finite]
+        lines = [line for line, ok in zip(lines, finite.tolist()) if ok]
+    return rows, file_idx, lines, malformed, polygons
+
+def check_polygons(polygons, n_files, valid_classes):
+    """
+    Check YOLO-seg polygon lines: numeric and finite coordinates (else
+    malformed), a known class and every vertex inside [0, 1].
+
+    Returns:
+        tuple: per-file counts (malformed, bad_class, out_of_range) and
+        has_polygon (per-file bool).
+    """
+    malformed = np.zeros(n_files, dtype=np.int64)
+    bad_class = np.zeros(n_files, dtype=np.int64)
+    out_of_range = np.zeros(n_files, dtype=np.int64)
+    has_polygon = np.zeros(n_files, dtype=bool)
+    for i, parts in polygons:
+        has_polygon[i] = True
+        try:
+            values = np.array(parts, dtype=np.float64)
+        except ValueError:
+            malformed[i] += 1
+            continue
+        if not np.isfinite(values).all():
+            malformed[i] += 1
+            continue
+        c = values[0]
+        if c != int(c) or not 0 <= c < len(valid_classes) or not valid_classes[int(c)]:
+            bad_class[i] += 1
+        if ((values[1:] < 0) | (values[1:] > 1)).any():
+            out_of_range[i] += 1
+    return malformed, bad_class, out_of_range, has_polygon
+
+def xywh_to_xyxy(boxes):
+    return np.stack([
+        boxes[:, 0] - boxes[:, 2] / 2,
+        boxes[:, 1] - boxes[:, 3] / 2,
+        boxes[:, 0] + boxes[:, 2] / 2,
+        boxes[:, 1] + boxes[:, 3] / 2,
+    ], axis=1)
+
+def xyxy_to_xywh(corners):
+    return np.stack([
+        (corners[:, 0] + corners[:, 2]) / 2,
+        (corners[:, 1] + corners[:, 3]) / 2,
+        corners[:, 2] - corners[:, 0],
+        corners[:, 3] - corners[:, 1],
+    ], axis=1)
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def find_duplicates(classes, corners, file_idx, iou_threshold):
+    """
+    Flag boxes that overlap an earlier box of the same class in the same file
+    by at least iou_threshold (one IoU matrix per file).
+    """
+    duplicate = np.zeros(len(classes), dtype=bool)
+    if len(classes) == 0:
+        return duplicate
+    starts = np.flatnonzero(np.r_[True, file_idx[1:] != file_idx[:-1], True])
+    for start, end in zip(starts[:-1], starts[1:]):
+        if end - start < 2:
+            continue
+        iou = box_iou(corners[start:end], corners[start:end])
+        same = classes[start:end, None] == classes[None, start:end]
+        earlier = np.tri(end - start, k=-1, dtype=bool)  # j < i
+        duplicate[start:end] = ((iou >= iou_threshold) & same & earlier).any(axis=1)
+    return duplicate
+
+def validate_shard(label_paths, valid_classes, fixed_dir=None, min_size=MIN_SIZE,
+                   iou_threshold=DUPLICATE_IOU):
+    """
+    Validate (and optionally repair) one batch of label files.
+
+    Repairs: out-of-range boxes are clipped to the image, and malformed lines,
+    unknown classes, degenerate boxes and duplicates are removed. Polygon
+    (YOLO-seg) lines are checked and reported but never repaired: files that
+    contain them are left as they are (copied unchanged to fixed_dir).
+
+    Returns:
+        dict: Partial report with per-issue counts and file names.
+    """
+    rows, file_idx, lines, malformed, polygons = read_label_files(label_paths)
+    poly_malformed, poly_bad_class, poly_out_of_range, has_polygon = check_polygons(
+        polygons, len(label_paths), valid_classes
+    )
+    malformed = malformed + poly_malformed
+    classes = rows[:, 0]
+    corners = xywh_to_xyxy(rows[:, 1:])
+
+    class_int = classes.astype(np.int64)
+    bad_class = (classes != class_int) | (class_int < 0) | (class_int >= len(valid_classes))
+    bad_class[~bad_class] = ~valid_classes[class_int[~bad_class]]
+
+    out_of_range = ((corners < 0) | (corners > 1)).any(axis=1)
+    clipped = np.clip(corners, 0, 1)
+    fixed_boxes = xyxy_to_xywh(clipped)
+    degenerate = (fixed_boxes[:, 2] < min_size) | (fixed_boxes[:, 3] < min_size)
+
+    candidates = ~bad_class & ~degenerate
+    duplicate = np.zeros(len(rows), dtype=bool)
+    idx = np.flatnonzero(candidates)
+    duplicate[idx] = find_duplicates(class_int[idx], clipped[idx], file_idx[idx], iou_threshold)
+
+    flags = {
+        "bad_class": bad_class,
+        "out_of_range": out_of_range,
+        "degenerate": degenerate,
+        "duplicate": duplicate,
+    }
+    report = {"files": len(label_paths), "boxes": len(rows) + len(polygons), "counts": {}, "files_with": {}}
+    names = [os.path.basename(p) for p in label_paths]
+    report["counts"]["malformed_line"] = int(malformed.sum())
+    report["files_with"]["malformed_line"] = [names[i] for i in np.flatnonzero(malformed)]
+    poly_counts = {"bad_class": poly_bad_class, "out_of_range": poly_out_of_range}
+    for issue, mask in flags.items():
+        per_file = np.bincount(file_idx[mask], minlength=len(label_paths)) + poly_counts.get(issue, 0)
+        report["counts"][issue] = int(per_file.sum())
+        report["files_with"][issue] = [names[i] for i in np.flatnonzero(per_file)]
+
+    if fixed_dir is not None:
+        drop = bad_class | degenerate | duplicate
+        changed = np.zeros(len(label_paths), dtype=bool)
+        changed[file_idx[drop | out_of_range]] = True
+        changed |= (malformed + poly_bad_class + poly_out_of_range) > 0
+        in_place = all(os.path.dirname(os.path.abspath(p)) == os.path.abspath(fixed_dir) for p in label_paths)
+
+        out_lines = [[] for _ in label_paths]
+        for r in np.flatnonzero(~drop).tolist():
+            if out_of_range[r]:
+                box = " ".join(map(str, fixed_boxes[r].tolist()))
+                out_lines[file_idx[r]].append(f"{class_int[r]} {box}")
+            else:
+                out_lines[file_idx[r]].append(lines[r])
+        os.makedirs(fixed_dir, exist_ok=True)
+        for i, name in enumerate(names):
+            if has_polygon[i]:
+                # Rewriting would drop the polygon lines, so keep the file as is
+                if not in_place:
+                    shutil.copyfile(label_paths[i], os.path.join(fixed_dir, name))
+                continue
+            if in_place and not changed[i]:
+                continue
+            with open(os.path.join(fixed_dir, name), "w") as f:
+                f.write("".join(line + "\n" for line in out_lines[i]))
+        report["files_repaired"] = int((changed & ~has_polygon).sum())
+        report["files_not_repaired"] = [names[i] for i in np.flatnonzero(changed & has_polygon)]
+
+    return report
+
+def _validate_shard_job(args):
+    return validate_shard(*args)
+
+def validate_labels(label_dir, names_yaml, report_path=None, fixed_dir=None, files_per_shard=FILES_PER_SHARD,
+                    workers=WORKERS, min_size=MIN_SIZE, iou_threshold=DUPLICATE_IOU):
+    """
+    Validate every label file in label_dir, in parallel across shards of files,
+    and write a compact JSON report (issue counts plus the files affected).
+    Repaired files are written to fixed_dir when it is given.
+    """
+    label_paths = sorted(os.path.join(label_dir, f) for f in os.listdir(label_dir) if f.endswith(".txt"))
+    valid_classes = load_valid_classes(names_yaml)
+    jobs = [
+        (label_paths[i:i + files_per_shard], valid_classes, fixed_dir, min_size, iou_threshold)
+        for i in range(0, len(label_paths), files_per_shard)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_validate_shard_job, jobs))
+
+    report = {
+        "label_dir": label_dir,
+        "names_yaml": names_yaml,
+        "files": sum(p["files"] for p in parts),
+        "boxes": sum(p["boxes"] for p in parts),
+        "counts": {issue: sum(p["counts"][issue] for p in parts) for issue in ISSUES},
+        "files_with": {issue: sorted(f for p in parts for f in p["files_with"][issue]) for issue in ISSUES},
+    }
+    if fixed_dir is not None:
+        report["fixed_dir"] = fixed_dir
+        report["files_repaired"] = sum(p["files_repaired"] for p in parts)
+        report["files_not_repaired"] = sorted(f for p in parts for f in p["files_not_repaired"])
+
+    if report_path is not None:
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(report, f)
+        print(f"Label report saved to {report_path}")
+    for issue in ISSUES:
+        print(f"{issue}: {report['counts'][issue]} ({len(report['files_with'][issue])} files)")
+    if report.get("files_not_repaired"):
+        print(f"{len(report['files_not_repaired'])} files with issues contain polygons and were not repaired")
+    return report
+
+if __name__ == "__main__":
+    validate_labels(
+        LABEL_DIR,
+        NAMES_YAML,
+        REPORT_PATH,
+        fixed_dir=(FIXED_LABEL_DIR or LABEL_DIR) if FIX else None,
+    )
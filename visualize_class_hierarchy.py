@@ -180,6 +180,66 @@ def build_path(node_name, dataframe, base_dir="class_hierarchy"):
     return os.path.join(base_dir, *path_parts)
 
 
+def get_descendants(node_name, dataframe):
+    """
+    Given a node name and a DataFrame of nodes, returns the set of all
+    descendants of that node (including the node itself).
+    """
+    to_visit = [node_name]
+    visited = set()
+    while to_visit:
+        current = to_visit.pop()
+        if current not in visited:
+            visited.add(current)
+            children = dataframe[dataframe["parent"] == current]["character"].tolist()
+            to_visit.extend(children)
+    return visited
+
+
+def build_node_frame(yaml_data):
+    """Run process_node over the whole YAML (rooted at "") and return the nodes as a DataFrame."""
+    nodes = []
+    process_node("", yaml_data, "", 0, None, nodes)
+    return pd.DataFrame(nodes)
+
+
+def write_sunburst(node_name, dataframe, base_output="class_hierarchy"):
+    """
+    Render the sunburst of one node's subtree and save it as
+    <base_output>/<path to node>/<node_name>.png. Returns the figure.
+    """
+    # Get all descendants of this node
+    descendants = get_descendants(node_name, dataframe)
+    
+    # Build sub-DataFrame for the subtree
+    sub_df = dataframe[dataframe["character"].isin(descendants)].copy()
+    
+    # Re-root so this node acts as the root of its subtree
+    sub_df.loc[sub_df["character"] == node_name, "parent"] = ""
+    
+    # Create the sunburst figure
+    fig = px.sunburst(
+        sub_df,
+        names="character",
+        parents="parent",
+        values="value",
+        color="character",
+        color_discrete_sequence=chosen_theme,
+        branchvalues="total",
+    )
+    
+    # Build a safe directory path for this node
+    dir_path = build_path(node_name, dataframe, base_dir=base_output)
+    os.makedirs(dir_path, exist_ok=True)
+    # The image filename can just be "<node_name>.png"
+    image_filename = os.path.join(dir_path, f"{node_name}.png")
+    
+    # Save the figure
+    fig.write_image(image_filename)
+    print(f"Saved sunburst for '{node_name}' -> {image_filename}")
+    return fig
+
+
 if __name__ == "__main__":
     # 1) Make sure the base output directory exists
     base_output = "class_hierarchy"
@@ -190,28 +250,9 @@ if __name__ == "__main__":
     with open(yaml_path, "r") as f:
         yaml_data = yaml.safe_load(f)
 
-    # 3) Build nodes via process_node
-    nodes = []
-    # Use "" as the root (with no parent) for clarity
-    process_node("", yaml_data, "", 0, None, nodes)
-
-    # 4) Create a DataFrame of all nodes
-    df = pd.DataFrame(nodes)
-
-    def get_descendants(node_name, dataframe):
-        """
-        Given a node name and a DataFrame of nodes, returns the set of all
-        descendants of that node (including the node itself).
-        """
-        to_visit = [node_name]
-        visited = set()
-        while to_visit:
-            current = to_visit.pop()
-            if current not in visited:
-                visited.add(current)
-                children = dataframe[dataframe["parent"] == current]["character"].tolist()
-                to_visit.extend(children)
-        return visited
+    # 3) Build nodes via process_node ("" is the root, with no parent)
+    # 4) and collect them in a DataFrame
+    df = build_node_frame(yaml_data)
 
     # 5) Identify nodes that actually have children (i.e. appear as a parent in df)
     #    (We also consider the root "" if it has children)
@@ -237,34 +278,7 @@ if __name__ == "__main__":
         if node_name == "":
             continue
 
-        # Get all descendants of this node
-        descendants = get_descendants(node_name, df)
-        
-        # Build sub-DataFrame for the subtree
-        sub_df = df[df["character"].isin(descendants)].copy()
-        
-        # Re-root so this node acts as the root of its subtree
-        sub_df.loc[sub_df["character"] == node_name, "parent"] = ""
-        
-        # Create the sunburst figure
-        fig = px.sunburst(
-            sub_df,
-            names="character",
-            parents="parent",
-            values="value",
-            color="character",
-            color_discrete_sequence=chosen_theme,
-            branchvalues="total",
-        )
-        
-        # Build a safe directory path for this node
-        dir_path = build_path(node_name, df, base_dir=base_output)
-        # The image filename can just be "<node_name>.png"
-        image_filename = os.path.join(dir_path, f"{node_name}.png")
-        
-        # Save the figure
-        fig.write_image(image_filename)
-        print(f"Saved sunburst for '{node_name}' -> {image_filename}")
+        fig = write_sunburst(node_name, df, base_output)
 
         # If this is the root node "class_dag" (or any top-level key you want),
         # you could store it for display later, e.g.:
@@ -1,13 +1,32 @@
 #!/usr/bin/env python3
 import os
 import random
-import cv2
 import yaml
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from pathlib import Path
 from collections import defaultdict
 
+from contact_sheet import TILE_SIZE, write_class_contact_sheets
+from image_loader import prefetch_images
+from map_coco_labels_2_class_hierarchy_labels import compile_label_mapping, remap_label_rows
+
+# Longest side (pixels) the example is rendered at: the axes of matplotlib's
+# default 6.4in x 100 dpi figure span 77.5% of its width, ~496px. COCO images
+# (<= 640px) are still decoded at full size for this; reduced JPEG decoding
+# only kicks in for images at least twice as large, or for contact-sheet tiles.
+THUMBNAIL_SIZE = 496
+
+# "figures" saves one matplotlib figure per example in a subdirectory per class;
+# "contact_sheet" tiles each class's examples into a single <class_name>.jpg
+GALLERY_MODE = "figures"
+WRITE_INDEX_SHEET = True  # contact_sheet mode: also write index.jpg with one tile per class
+
+# Names YAML the label files were written with; their class ids are remapped
+# into the config's names through the compiled mapping (None = the config itself)
+LABEL_NAMES_YAML = None
+UNMAPPED_POLICY = "error"  # see map_coco_labels_2_class_hierarchy_labels.UNMAPPED_POLICIES
+
 def load_yaml_file(yaml_path):
     """
     Load and parse a YAML file.
@@ -89,6 +108,12 @@ def main():
     
     # Build a map: leaf_class_name -> list_of_ancestor_names
     parent_map = build_parent_map(class_dag)
+
+    # Compiled label-file -> config index mapping; ids it cannot map fail or
+    # are dropped according to UNMAPPED_POLICY
+    label_mapping = compile_label_mapping(LABEL_NAMES_YAML or yaml_path, yaml_path)
+    if label_mapping.unmapped:
+        print(f"Classes without a counterpart in {yaml_path}: {sorted(label_mapping.unmapped)}")
     
     # Directories for images and labels
     base_path = Path(data_path)
@@ -104,7 +129,8 @@ def main():
     class_id_to_subdir = {}
     for class_id, class_name in enumerate(names):
         subdir = example_images_dir / class_name
-        os.makedirs(subdir, exist_ok=True)
+        if GALLERY_MODE == "figures":
+            os.makedirs(subdir, exist_ok=True)
         class_id_to_subdir[class_id] = subdir
     
     # Gather images that contain each class
@@ -138,21 +164,18 @@ def main():
         
         # Read the label file line by line
         with open(label_file_path, 'r') as lf:
-            for line in lf:
-                parts = line.strip().split()
-                if len(parts) < 5:
-                    # Invalid label line
-                    continue
-                class_id = int(parts[0])
-                if class_id < 0 or class_id >= len(names):
-                    # Invalid class id
-                    continue
-                class_to_files[class_id].append(image_file)
+            rows = [parts for parts in (line.strip().split() for line in lf) if len(parts) >= 5]
+        for class_id, _ in remap_label_rows(rows, label_mapping, UNMAPPED_POLICY, label_file_path):
+            if class_id < 0 or class_id >= len(names):
+                # Unmapped id kept by the "keep" policy
+                continue
+            class_to_files[class_id].append(image_file)
     
     # Keep track of classes that have no images
     missing_classes = []
     
     # For each class, pick up to 3 images, draw bounding boxes, and save
+    chosen = []
     for class_id, image_list in class_to_files.items():
         class_name = names[class_id]
         subdir = class_id_to_subdir[class_id]
@@ -167,21 +190,44 @@ def main():
         
         # Shuffle and pick up to 3 images
         random.shuffle(image_list)
-        chosen_images = image_list[:3]
-        
-        for idx, img_path in enumerate(chosen_images, start=1):
-            # Read original image
-            image_bgr = cv2.imread(str(img_path))
-            if image_bgr is None:
+        for idx, img_path in enumerate(image_list[:3], start=1):
+            chosen.append((class_id, idx, img_path))
+
+    # Decode the chosen images at the size they are drawn at (thumbnail or
+    # contact-sheet tile), prefetching the next ones on a background thread
+    # while the current one is drawn
+    target_size = TILE_SIZE if GALLERY_MODE == "contact_sheet" else THUMBNAIL_SIZE
+    images = prefetch_images([img_path for _, _, img_path in chosen], target_size)
+
+    if GALLERY_MODE == "contact_sheet":
+        # One mosaic per class (plus an index sheet), drawn directly on the arrays
+        write_class_contact_sheets(
+            chosen,
+            images,
+            names,
+            label_path_for=lambda img_path: train_labels_dir / f"{img_path.stem}.txt",
+            label_text_for=lambda cid: (
+                "\n".join(get_full_chain(cid, names, parent_map)) if 0 <= cid < len(names) else None
+            ),
+            save_dir=example_images_dir,
+            index_sheet=WRITE_INDEX_SHEET,
+            label_mapping=label_mapping,
+            policy=UNMAPPED_POLICY,
+        )
+    else:
+        # For each chosen image, draw bounding boxes and save
+        for (class_id, idx, img_path), image_rgb in zip(chosen, images):
+            class_name = names[class_id]
+            subdir = class_id_to_subdir[class_id]
+            if image_rgb is None:
                 continue
-            image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
             img_h, img_w, _ = image_rgb.shape
-            
+        
             # Prepare matplotlib figure
             fig, ax = plt.subplots()
             ax.imshow(image_rgb)
             ax.axis('off')
-            
+        
             # Read the corresponding label file to get bounding boxes
             label_file_name = img_path.stem + ".txt"
             label_file_path = train_labels_dir / label_file_name
@@ -192,61 +238,58 @@ def main():
                 plt.savefig(str(image_save_path), bbox_inches='tight', pad_inches=0)
                 plt.close(fig)
                 continue
-            
+        
             with open(label_file_path, 'r') as lf:
-                for line in lf:
-                    parts = line.strip().split()
-                    if len(parts) < 5:
-                        continue
-                    cid = int(parts[0])
-                    x_center = float(parts[1])
-                    y_center = float(parts[2])
-                    box_w = float(parts[3])
-                    box_h = float(parts[4])
-                    
-                    if cid < 0 or cid >= len(names):
-                        continue
-                    
-                    # Convert YOLO coords to pixel coords
-                    x_center_pixel = x_center * img_w
-                    y_center_pixel = y_center * img_h
-                    w_pixel = box_w * img_w
-                    h_pixel = box_h * img_h
+                rows = [parts for parts in (line.strip().split() for line in lf) if len(parts) >= 5]
+            for cid, parts in remap_label_rows(rows, label_mapping, UNMAPPED_POLICY, label_file_path):
+                x_center = float(parts[1])
+                y_center = float(parts[2])
+                box_w = float(parts[3])
+                box_h = float(parts[4])
+            
+                if cid < 0 or cid >= len(names):
+                    continue
+            
+                # Convert YOLO coords to pixel coords
+                x_center_pixel = x_center * img_w
+                y_center_pixel = y_center * img_h
+                w_pixel = box_w * img_w
+                h_pixel = box_h * img_h
 
-                    x_min = x_center_pixel - (w_pixel / 2)
-                    y_min = y_center_pixel - (h_pixel / 2)
-                    
-                    # Retrieve full hierarchical chain
-                    chain = get_full_chain(cid, names, parent_map)
-                    # Join into multi-line string
-                    chain_str = "\n".join(chain)
+                x_min = x_center_pixel - (w_pixel / 2)
+                y_min = y_center_pixel - (h_pixel / 2)
+            
+                # Retrieve full hierarchical chain
+                chain = get_full_chain(cid, names, parent_map)
+                # Join into multi-line string
+                chain_str = "\n".join(chain)
 
-                    # Draw bounding box
-                    rect = patches.Rectangle(
-                        (x_min, y_min),
-                        w_pixel,
-                        h_pixel,
-                        linewidth=2,
-                        edgecolor='red',
-                        facecolor='none'
-                    )
-                    ax.add_patch(rect)
+                # Draw bounding box
+                rect = patches.Rectangle(
+                    (x_min, y_min),
+                    w_pixel,
+                    h_pixel,
+                    linewidth=2,
+                    edgecolor='red',
+                    facecolor='none'
+                )
+                ax.add_patch(rect)
 
-                    # Add hierarchical label
-                    ax.text(
-                        x_min,
-                        y_min,
-                        chain_str,
-                        verticalalignment='top',
-                        color='white',
-                        bbox=dict(facecolor='red', alpha=0.5, pad=0.5)
-                    )
-            
+                # Add hierarchical label
+                ax.text(
+                    x_min,
+                    y_min,
+                    chain_str,
+                    verticalalignment='top',
+                    color='white',
+                    bbox=dict(facecolor='red', alpha=0.5, pad=0.5)
+                )
+    
             # Save the figure
             image_save_path = subdir / f"{img_path.stem}_example_{idx}.jpg"
             plt.savefig(str(image_save_path), bbox_inches='tight', pad_inches=0)
             plt.close(fig)
-            
+        
             print(f"Saved example image for class '{class_name}' -> {image_save_path}")
     
     # Write missing classes to a file
@@ -1,10 +1,29 @@
 import os
 import yaml
 import random
-import cv2
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 
+from contact_sheet import TILE_SIZE, write_class_contact_sheets
+from image_loader import prefetch_images
+from map_coco_labels_2_class_hierarchy_labels import compile_label_mapping, remap_label_rows
+
+# Longest side (pixels) the example is rendered at: the axes of matplotlib's
+# default 6.4in x 100 dpi figure span 77.5% of its width, ~496px. COCO images
+# (<= 640px) are still decoded at full size for this; reduced JPEG decoding
+# only kicks in for images at least twice as large, or for contact-sheet tiles.
+THUMBNAIL_SIZE = 496
+
+# "figures" saves one matplotlib figure per example in a subdirectory per class;
+# "contact_sheet" tiles each class's examples into a single <class_name>.jpg
+GALLERY_MODE = "figures"
+WRITE_INDEX_SHEET = True  # contact_sheet mode: also write index.jpg with one tile per class
+
+# Names YAML the label files were written with; their class ids are remapped
+# into the displayed names through the compiled mapping (None = same YAML)
+LABEL_NAMES_YAML = None
+UNMAPPED_POLICY = "error"  # see map_coco_labels_2_class_hierarchy_labels.UNMAPPED_POLICIES
+
 def main():
     # 1) Hard-code paths to YOLO directory and id2names.yaml
     YOLO_DIR = "yolo_format/class_hierarchy/train"
@@ -16,11 +35,18 @@ def main():
         data = yaml.safe_load(f)
     id2names = data["names"]  # Dict like {0: 'person', 1: 'bicycle', ...}
 
+    # Compiled label-file -> display index mapping; ids it cannot map fail or
+    # are dropped according to UNMAPPED_POLICY
+    label_mapping = compile_label_mapping(LABEL_NAMES_YAML or ID2NAMES_PATH, ID2NAMES_PATH)
+    if label_mapping.unmapped:
+        print(f"Classes without a counterpart in {ID2NAMES_PATH}: {sorted(label_mapping.unmapped)}")
+
     # 3) Create save_path directory plus subdirectories for each class name
     os.makedirs(save_path, exist_ok=True)
-    for class_id, class_name in id2names.items():
-        class_subdir = os.path.join(save_path, class_name)
-        os.makedirs(class_subdir, exist_ok=True)
+    if GALLERY_MODE == "figures":
+        for class_id, class_name in id2names.items():
+            class_subdir = os.path.join(save_path, class_name)
+            os.makedirs(class_subdir, exist_ok=True)
 
     # 4) Find all label files in YOLO's "labels" folder and map each class_id to the images that contain it
     labels_path = os.path.join(YOLO_DIR, "labels")
@@ -49,19 +75,17 @@ def main():
 
         # Parse the label file line by line
         with open(label_path, 'r') as lf:
-            for line in lf:
-                parts = line.strip().split()
-                if len(parts) != 5:
-                    continue
-                class_id = int(parts[0])
-                if class_id in class_to_files:
-                    # This image has class_id
-                    class_to_files[class_id].append(image_file)
+            rows = [parts for parts in (line.strip().split() for line in lf) if len(parts) == 5]
+        for class_id, _ in remap_label_rows(rows, label_mapping, UNMAPPED_POLICY, label_path):
+            if class_id in class_to_files:
+                # This image has class_id
+                class_to_files[class_id].append(image_file)
 
     # A list to track which classes have no examples
     missing_classes = []
 
     # 5) For each class, pick 3 random images (if available), then plot bounding boxes and save
+    chosen = []
     for class_id, image_list in class_to_files.items():
         class_name = id2names[class_id]
         class_subdir = os.path.join(save_path, class_name)
@@ -78,10 +102,35 @@ def main():
 
         # Shuffle and take up to 3 images
         random.shuffle(image_list)
-        chosen_images = image_list[:3]
-
+        for idx, img_path in enumerate(image_list[:3], start=1):
+            chosen.append((class_id, idx, img_path))
+
+    # Decode the chosen images at the size they are drawn at (thumbnail or
+    # contact-sheet tile), prefetching the next ones on a background thread
+    # while the current one is drawn
+    target_size = TILE_SIZE if GALLERY_MODE == "contact_sheet" else THUMBNAIL_SIZE
+    images = prefetch_images([img_path for _, _, img_path in chosen], target_size)
+
+    if GALLERY_MODE == "contact_sheet":
+        # One mosaic per class (plus an index sheet), drawn directly on the arrays
+        write_class_contact_sheets(
+            chosen,
+            images,
+            id2names,
+            label_path_for=lambda img_path: os.path.join(
+                labels_path, os.path.splitext(os.path.basename(img_path))[0] + ".txt"
+            ),
+            label_text_for=lambda cid: id2names.get(cid, str(cid)),
+            save_dir=save_path,
+            index_sheet=WRITE_INDEX_SHEET,
+            label_mapping=label_mapping,
+            policy=UNMAPPED_POLICY,
+        )
+    else:
         # For each chosen image, draw bounding boxes and save
-        for idx, img_path in enumerate(chosen_images, start=1):
+        for (class_id, idx, img_path), image_rgb in zip(chosen, images):
+            class_name = id2names[class_id]
+            class_subdir = os.path.join(save_path, class_name)
             # Read the corresponding label file again to get bounding boxes
             image_filename = os.path.splitext(os.path.basename(img_path))[0]
             label_file_name = image_filename + ".txt"
@@ -89,11 +138,8 @@ def main():
             if not os.path.isfile(label_file_path):
                 continue
 
-            # Read image (BGR) and convert to RGB for plotting
-            image_bgr = cv2.imread(img_path)
-            if image_bgr is None:
+            if image_rgb is None:
                 continue
-            image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
             img_h, img_w, _ = image_rgb.shape
 
             # Plot with matplotlib
@@ -103,49 +149,46 @@ def main():
 
             # Parse label info to draw bounding boxes
             with open(label_file_path, 'r') as lf:
-                for line in lf:
-                    parts = line.strip().split()
-                    if len(parts) != 5:
-                        continue
-                    cid = int(parts[0])
-                    x_center = float(parts[1])
-                    y_center = float(parts[2])
-                    width = float(parts[3])
-                    height = float(parts[4])
-
-                    # Convert YOLO normalized coords to pixel coords
-                    x_center_pixel = x_center * img_w
-                    y_center_pixel = y_center * img_h
-                    w_pixel = width * img_w
-                    h_pixel = height * img_h
-
-                    # Top-left corner
-                    x_min = x_center_pixel - (w_pixel / 2)
-                    y_min = y_center_pixel - (h_pixel / 2)
-
-                    # The label for the bounding box
-                    bbox_class_name = id2names.get(cid, str(cid))
-
-                    # Draw the bounding box
-                    rect = patches.Rectangle(
-                        (x_min, y_min),
-                        w_pixel,
-                        h_pixel,
-                        linewidth=2,
-                        edgecolor='red',
-                        facecolor='none'
-                    )
-                    ax.add_patch(rect)
-
-                    # Add text label at top-left corner
-                    ax.text(
-                        x_min,
-                        y_min,
-                        bbox_class_name,
-                        verticalalignment='top',
-                        color='white',
-                        bbox=dict(facecolor='red', alpha=0.5, pad=0.5)
-                    )
+                rows = [parts for parts in (line.strip().split() for line in lf) if len(parts) == 5]
+            for cid, parts in remap_label_rows(rows, label_mapping, UNMAPPED_POLICY, label_file_path):
+                x_center = float(parts[1])
+                y_center = float(parts[2])
+                width = float(parts[3])
+                height = float(parts[4])
+
+                # Convert YOLO normalized coords to pixel coords
+                x_center_pixel = x_center * img_w
+                y_center_pixel = y_center * img_h
+                w_pixel = width * img_w
+                h_pixel = height * img_h
+
+                # Top-left corner
+                x_min = x_center_pixel - (w_pixel / 2)
+                y_min = y_center_pixel - (h_pixel / 2)
+
+                # The label for the bounding box
+                bbox_class_name = id2names.get(cid, str(cid))
+
+                # Draw the bounding box
+                rect = patches.Rectangle(
+                    (x_min, y_min),
+                    w_pixel,
+                    h_pixel,
+                    linewidth=2,
+                    edgecolor='red',
+                    facecolor='none'
+                )
+                ax.add_patch(rect)
+
+                # Add text label at top-left corner
+                ax.text(
+                    x_min,
+                    y_min,
+                    bbox_class_name,
+                    verticalalignment='top',
+                    color='white',
+                    bbox=dict(facecolor='red', alpha=0.5, pad=0.5)
+                )
 
             # Save the figure to the class subdir
             image_save_path = os.path.join(class_subdir, f"{image_filename}_example_{idx}.jpg")